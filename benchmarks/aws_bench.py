@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+'''
+aws_bench.py measures the dreambox.aws layer offline.  It runs the core,
+security, autoscaling, cloudformation and ec2 helpers against recorded json
+fixtures instead of AWS, and reports calls per second, p50/p95 latency and
+how many aws calls (subprocesses for the cli backend) each function makes.
+
+    python benchmarks/aws_bench.py                      # cli backend, fake aws executable
+    python benchmarks/aws_bench.py --backend fixture    # in process, no subprocesses
+    python benchmarks/aws_bench.py --fixtures DIR       # use recorded fixtures from DIR
+    python benchmarks/aws_bench.py --only security      # functions whose name contains security
+
+fixtures are named <cmd>.<subcmd>.json and hold the raw (unqueried) awscli
+output.  When --fixtures is not given, a synthetic account with --stages
+stages is generated into a temporary directory.  To record real fixtures,
+save the output of e.g. `aws ec2 describe-instances` as
+ec2.describe-instances.json.
+'''
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_aws
+
+REGIONS = ['us-east-1', 'us-west-2']
+
+
+def generate_fixtures(path=None, stages=9, hosts_per_stage=20):
+    '''
+    write a synthetic account with a number of stage environments to path
+    '''
+    apps = ['play', 'web', 'api', 'db', 'cron']
+    instances, security_groups, db_groups, cache_groups, cluster_groups = [], [], [], [], []
+    asgs, stacks, snapshots = [], [], []
+    for n in range(1, stages + 1):
+        stage = 'stage%d' % n
+        stacks.append({'StackName': stage,
+                       'StackStatus': 'CREATE_COMPLETE',
+                       'Parameters': [{'ParameterKey': 'env', 'ParameterValue': stage}]})
+        for app in apps:
+            name = '%s-%s' % (stage, app)
+            stacks.append({'StackName': '%s-stack' % name,
+                           'StackStatus': 'CREATE_COMPLETE',
+                           'Parameters': []})
+            security_groups.append({
+                'GroupName': name,
+                'GroupId': 'sg-%08d' % len(security_groups),
+                'IpPermissions': [{'IpProtocol': 'tcp', 'FromPort': port, 'ToPort': port,
+                                   'IpRanges': [{'CidrIp': '10.%d.0.0/16' % n}],
+                                   'UserIdGroupPairs': []}
+                                  for port in (22, 80, 443)]})
+            grants = [{'EC2SecurityGroupName': name, 'EC2SecurityGroupOwnerId': '123456789012'}]
+            db_groups.append({'DBSecurityGroupName': '%s-db' % name, 'EC2SecurityGroups': grants})
+            cache_groups.append({'CacheSecurityGroupName': '%s-cache' % name,
+                                 'EC2SecurityGroups': grants,
+                                 'OwnerId': '123456789012'})
+            cluster_groups.append({'ClusterSecurityGroupName': '%s-redshift' % name,
+                                   'EC2SecurityGroups': grants})
+            asg_instances = []
+            for h in range(hosts_per_stage // len(apps)):
+                instance_id = 'i-%08x' % len(instances)
+                asg_instances.append({'InstanceId': instance_id,
+                                      'LaunchConfigurationName': '%s-lc' % name})
+                instances.append({'InstanceId': instance_id,
+                                  'PublicDnsName': 'ec2-%s.compute.amazonaws.com' % instance_id,
+                                  'PublicIpAddress': '54.0.%d.%d' % (n, h),
+                                  'PrivateIpAddress': '10.%d.0.%d' % (n, h),
+                                  'PrivateDnsName': 'ip-10-%d-0-%d.ec2.internal' % (n, h),
+                                  'State': {'Name': 'running'},
+                                  'SecurityGroups': [{'GroupName': name, 'GroupId': 'sg-%08d' % n}],
+                                  'Tags': [{'Key': 'Name', 'Value': '%s-%d' % (name, h)}]})
+            asgs.append({'AutoScalingGroupName': '%s-asg' % name,
+                         'Instances': asg_instances,
+                         'SuspendedProcesses': [],
+                         'Tags': [{'Key': 'Name', 'Value': name}]})
+            snapshots.append({'DBSnapshotIdentifier': '%s-%s-snapshot' % (stage, app),
+                              'SnapshotCreateTime': '2016-01-%02dT00:00:00Z' % n,
+                              'SnapshotType': 'manual'})
+
+    fixtures = {
+        'ec2.describe-instances': {'Reservations': [{'Instances': [i]} for i in instances]},
+        'ec2.describe-security-groups': {'SecurityGroups': security_groups},
+        'rds.describe-db-security-groups': {'DBSecurityGroups': db_groups},
+        'rds.describe-db-snapshots': {'DBSnapshots': snapshots},
+        'elasticache.describe-cache-security-groups': {'CacheSecurityGroups': cache_groups},
+        'redshift.describe-cluster-security-groups': {'ClusterSecurityGroups': cluster_groups},
+        'autoscaling.describe-auto-scaling-groups': {'AutoScalingGroups': asgs},
+        'cloudformation.describe-stacks': {'Stacks': stacks},
+    }
+    for name, fixture in fixtures.items():
+        with open(os.path.join(path, '%s.json' % name), 'w') as fh:
+            json.dump(fixture, fh)
+
+
+class FixtureBackend(object):
+    '''
+    an in process dreambox.aws.core backend that answers from fixtures, to
+    measure the library without any process startup.  Filters are applied
+    like fake_aws.py applies them; paging is not supported, so a list comes
+    back as one page
+    '''
+    name = 'fixture'
+
+    def __init__(self, path=None):
+        import jmespath
+        self._jmespath = jmespath
+        self._path = path
+        self._fixtures = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, cmd=None, subcmd=None, verbose=False, **kwargs):
+        name = '%s.%s' % (cmd, subcmd)
+        # the helpers call the backend from many threads at once
+        with self._lock:
+            self.calls += 1
+            if name not in self._fixtures:
+                filename = os.path.join(self._path, '%s.json' % name)
+                if not os.path.exists(filename):
+                    self._fixtures[name] = None
+                else:
+                    with open(filename, 'r') as fh:
+                        self._fixtures[name] = fh.read()
+            fixture = self._fixtures[name]
+        if fixture is None:
+            return None
+        result = json.loads(fixture)
+        if kwargs.get('filters'):
+            result = fake_aws.apply_filters(cmd, subcmd, result, kwargs['filters'])
+        if kwargs.get('query'):
+            result = self._jmespath.search(kwargs['query'], result)
+        return result
+
+
+def install_fake_aws(workdir=None, fixtures=None):
+    '''
+    put an aws executable that runs fake_aws.py first on PATH, and return
+    the file it counts invocations in
+    '''
+    bindir = os.path.join(workdir, 'bin')
+    os.mkdir(bindir)
+    wrapper = os.path.join(bindir, 'aws')
+    with open(wrapper, 'w') as fh:
+        fh.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (sys.executable, os.path.join(BENCH_DIR, 'fake_aws.py')))
+    os.chmod(wrapper, os.stat(wrapper).st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+
+    counter = os.path.join(workdir, 'calls.log')
+    open(counter, 'w').close()
+    os.environ['PATH'] = bindir + os.pathsep + os.environ.get('PATH', '')
+    os.environ['FAKE_AWS_FIXTURES'] = fixtures
+    os.environ['FAKE_AWS_COUNTER'] = counter
+    return counter
+
+
+def count_lines(filename=None):
+    with open(filename, 'r') as fh:
+        return sum(1 for _ in fh)
+
+
+def percentile(values=None, pct=50):
+    ordered = sorted(values)
+    index = int(round((pct / 100.0) * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def benchmarks():
+    '''
+    return (name, function) pairs to measure.  The modules are imported
+    here, after the fake aws executable is on PATH.
+    '''
+    import dreambox.aws.core as aws
+    import dreambox.aws.security as security
+    import dreambox.aws.autoscaling as autoscaling
+    import dreambox.aws.cloudformation as cloudformation
+    import dreambox.aws.ec2 as ec2
+
+    return [
+        ('core.ec2 describe-instances',
+         lambda: aws.ec2('describe-instances', region='us-west-2',
+                         query='Reservations[].Instances[].[InstanceId,Tags[?Key==`Name`].Value]')),
+        ('core.json_to_pyobj describe-stacks',
+         lambda: aws.json_to_pyobj(aws.cloudformation('describe-stacks', region='us-west-2')).Stacks[0].StackName),
+        ('security.get_all_security_groups',
+         lambda: security.get_all_security_groups(my_filterby='stage3')),
+        ('security.get_all_security_groups parallel',
+         lambda: security.get_all_security_groups(my_filterby='stage3', parallel=True)),
+        ('security.get_ingress_revocations',
+         lambda: security.get_ingress_revocations(filterby='stage3')),
+        ('autoscaling.get_all_autoscaling_group_from',
+         lambda: autoscaling.get_all_autoscaling_group_from(region='us-west-2', filterby='stage3')),
+        ('autoscaling.get_only_play_asgs',
+         lambda: autoscaling.get_only_play_asgs(ec2profile='', ec2region='us-west-2', env='stage3')),
+        ('autoscaling.get_ec2_instances_hostnames_from_asg_groups',
+         lambda: autoscaling.get_ec2_instances_hostnames_from_asg_groups(
+             ec2region='us-west-2',
+             asg_group=autoscaling.get_only_play_asgs(ec2profile='', ec2region='us-west-2', env='stage3'))),
+        ('autoscaling.suspend_autoscaling_groups_for_stage',
+         lambda: autoscaling.suspend_autoscaling_groups_for_stage(region='us-west-2', filterby='stage3')),
+        ('cloudformation.get_stack_names_from_all_regions',
+         lambda: cloudformation.get_stack_names_from_all_regions()),
+        ('cloudformation.get_all_stacks_for_stage',
+         lambda: cloudformation.get_all_stacks_for_stage(region='us-west-2', filterby='stage3')),
+        ('ec2.get_ec2_hosts_for_stage',
+         lambda: ec2.get_ec2_hosts_for_stage(stage='stage3')),
+    ]
+
+
+def run(iterations=10, only=None, counter=None, backend=None):
+    results = []
+    for name, func in benchmarks():
+        if only and only not in name:
+            continue
+        # silence the progress messages the helpers print
+        stdout, stderr = sys.stdout, sys.stderr
+        devnull = open(os.devnull, 'w')
+        latencies = []
+        calls_before = count_lines(counter) if counter else backend.calls
+        error = None
+        try:
+            sys.stdout = sys.stderr = devnull
+            for _ in range(iterations):
+                start = time.time()
+                func()
+                latencies.append(time.time() - start)
+        except Exception as err:
+            error = err
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            devnull.close()
+        calls = (count_lines(counter) if counter else backend.calls) - calls_before
+        results.append((name, latencies, calls, error))
+    return results
+
+
+def report(results=None, unit='subprocs'):
+    header = '%-60s %10s %10s %10s %10s' % ('function', 'calls/s', 'p50 ms', 'p95 ms', unit + '/call')
+    print(header)
+    print('-' * len(header))
+    for name, latencies, calls, error in results:
+        if error is not None:
+            print('%-60s failed: %s' % (name, error))
+            continue
+        total = sum(latencies)
+        print('%-60s %10.2f %10.2f %10.2f %10.1f' % (name,
+                                                    len(latencies) / total if total else 0,
+                                                    percentile(latencies, 50) * 1000,
+                                                    percentile(latencies, 95) * 1000,
+                                                    float(calls) / len(latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='aws_bench',
+                                     description='benchmark dreambox.aws against recorded fixtures')
+    parser.add_argument('--backend', choices=['cli', 'fixture'], default='cli',
+                        help='cli spawns a fake aws executable, fixture answers in process')
+    parser.add_argument('--fixtures', help='a directory of recorded <cmd>.<subcmd>.json fixtures')
+    parser.add_argument('--stages', type=int, default=9, help='stages in the generated account')
+    parser.add_argument('--iterations', type=int, default=10, help='runs per function')
+    parser.add_argument('--only', help='only run functions whose name contains this')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='aws-bench-')
+    try:
+        fixtures = args.fixtures
+        if fixtures is None:
+            fixtures = os.path.join(workdir, 'fixtures')
+            os.mkdir(fixtures)
+            generate_fixtures(fixtures, stages=args.stages)
+
+        counter, backend = None, None
+        if args.backend == 'cli':
+            counter = install_fake_aws(workdir, os.path.abspath(fixtures))
+        import dreambox.aws.core as aws
+        if args.backend == 'fixture':
+            backend = aws.set_backend(FixtureBackend(fixtures))
+        else:
+            aws.set_backend('cli')
+
+        results = run(args.iterations, args.only, counter, backend)
+        report(results, 'subprocs' if counter else 'calls')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+'''
+fake_aws.py is a stand-in for the awscli command line tool.  It answers
+
+    aws [--option=value ...] <cmd> <subcmd> [--option=value ...]
+
+from recorded json fixtures instead of calling AWS.  The fixture for a
+command is read from $FAKE_AWS_FIXTURES/<cmd>.<subcmd>.json, and --query is
+applied with jmespath the same way awscli applies it.  --filters is honoured
+for the filters listed in FILTER_FIELDS (others are ignored, so they match
+everything), and --max-items / --starting-token page through the list of
+the fixture and add a NextToken while there is more.  Sub-commands without
+a fixture that change resources (revoke-*, delete-*, suspend-*, ...) succeed
+and print nothing, like awscli does.  Any other missing fixture exits with
+255.
+
+every invocation is appended to $FAKE_AWS_COUNTER when it is set, so a caller
+can count how many processes were spawned.
+'''
+from __future__ import print_function
+import json
+import os
+import re
+import sys
+
+import jmespath
+
+MUTATING_PREFIXES = ('revoke-', 'authorize-', 'delete-', 'create-', 'suspend-',
+                     'resume-', 'put-', 'modify-', 'update-')
+
+# the values a --filters name is matched against, per item of a fixture.
+# Filters that are not listed here are ignored
+FILTER_FIELDS = {
+    ('ec2', 'describe-instances'): {
+        'tag:Name': lambda i: [t['Value'] for t in i.get('Tags', []) if t['Key'] == 'Name'],
+        'tag-key': lambda i: [t['Key'] for t in i.get('Tags', [])],
+        'instance-id': lambda i: [i.get('InstanceId')],
+        'instance-state-name': lambda i: [i.get('State', {}).get('Name')],
+        'instance.group-id': lambda i: [g['GroupId'] for g in i.get('SecurityGroups', [])],
+        'instance.group-name': lambda i: [g['GroupName'] for g in i.get('SecurityGroups', [])],
+    },
+    ('ec2', 'describe-security-groups'): {
+        'group-name': lambda g: [g.get('GroupName')],
+        'group-id': lambda g: [g.get('GroupId')],
+        'tag:Name': lambda g: [t['Value'] for t in g.get('Tags', []) if t['Key'] == 'Name'],
+        'vpc-id': lambda g: [g.get('VpcId')],
+    },
+    ('rds', 'describe-db-snapshots'): {
+        'db-instance-id': lambda s: [s.get('DBInstanceIdentifier')],
+        'db-snapshot-id': lambda s: [s.get('DBSnapshotIdentifier')],
+        'snapshot-type': lambda s: [s.get('SnapshotType')],
+        'engine': lambda s: [s.get('Engine')],
+    },
+}
+
+
+def filter_regex(value=None):
+    '''
+    compile a filter value the way AWS matches it: case sensitive, * and ?
+    are wildcards, and a backslash escapes the next character
+    '''
+    pattern = ''
+    escaped = False
+    for c in value:
+        if escaped:
+            pattern += re.escape(c)
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == '*':
+            pattern += '.*'
+        elif c == '?':
+            pattern += '.'
+        else:
+            pattern += re.escape(c)
+    return re.compile(pattern + r'\Z', re.S)
+
+
+def apply_filters(cmd=None, subcmd=None, result=None, filters=None):
+    '''
+    drop the items of result that do not match a json --filters value.  The
+    instances of describe-instances are filtered inside their reservations,
+    and a reservation left empty is dropped.
+    '''
+    fields = FILTER_FIELDS.get((cmd, subcmd), {})
+    tests = [(fields[f['Name']], [filter_regex(v) for v in f['Values']])
+             for f in json.loads(filters) if f['Name'] in fields]
+    if not tests:
+        return result
+
+    def matches(item):
+        return all(any(r.match(value) for r in regexes
+                                      for value in field(item) if value is not None)
+                   for field, regexes in tests)
+
+    result = dict(result)
+    if (cmd, subcmd) == ('ec2', 'describe-instances'):
+        reservations = []
+        for reservation in result.get('Reservations', []):
+            instances = [i for i in reservation.get('Instances', []) if matches(i)]
+            if instances:
+                reservations.append(dict(reservation, Instances=instances))
+        result['Reservations'] = reservations
+    else:
+        key = list_key(result)
+        if key is not None:
+            result[key] = [item for item in result[key] if matches(item)]
+    return result
+
+
+def list_key(result=None):
+    '''
+    return the key of the list a fixture holds, i.e. Reservations
+    '''
+    keys = [k for k, v in result.items() if isinstance(v, list)] \
+        if isinstance(result, dict) else []
+    return keys[0] if len(keys) == 1 else None
+
+
+def paginate(result=None, max_items=None, starting_token=None):
+    '''
+    return the max_items items of the list in result that start at
+    starting_token, with a NextToken when there are more
+    '''
+    key = list_key(result)
+    if key is None:
+        return result
+    start = int(starting_token or 0)
+    end = start + int(max_items)
+    items = result[key]
+    result = dict(result)
+    result[key] = items[start:end]
+    if end < len(items):
+        result['NextToken'] = str(end)
+    return result
+
+
+def parse_args(argv=None):
+    positional = []
+    options = {}
+    index = 0
+    while index < len(argv):
+        arg = argv[index]
+        if arg.startswith('--'):
+            if '=' in arg:
+                name, value = arg[2:].split('=', 1)
+            elif index + 1 < len(argv) and not argv[index + 1].startswith('--'):
+                # an option takes every value up to the next option, i.e.
+                # --auto-scaling-group-names asg1 asg2
+                values = []
+                while index + 1 < len(argv) and not argv[index + 1].startswith('--'):
+                    values.append(argv[index + 1])
+                    index += 1
+                name, value = arg[2:], values[0] if len(values) == 1 else values
+            else:
+                name, value = arg[2:], True
+            options[name] = value
+        else:
+            positional.append(arg)
+        index += 1
+    return positional, options
+
+
+def main(argv=None):
+    positional, options = parse_args(argv)
+    if len(positional) < 2:
+        print('usage: aws <cmd> <subcmd> [options]', file=sys.stderr)
+        return 255
+    cmd, subcmd = positional[0:2]
+
+    counter = os.environ.get('FAKE_AWS_COUNTER')
+    if counter:
+        with open(counter, 'a') as fh:
+            fh.write('%s %s\n' % (cmd, subcmd))
+
+    fixtures = os.environ.get('FAKE_AWS_FIXTURES', os.path.join(os.path.dirname(__file__), 'fixtures'))
+    fixture = os.path.join(fixtures, '%s.%s.json' % (cmd, subcmd))
+    if not os.path.exists(fixture):
+        if subcmd.startswith(MUTATING_PREFIXES):
+            return 0
+        print('An error occurred (InvalidAction) when calling %s %s: no fixture %s' %
+              (cmd, subcmd, fixture), file=sys.stderr)
+        return 255
+
+    with open(fixture, 'r') as fh:
+        result = json.load(fh)
+    if options.get('filters'):
+        result = apply_filters(cmd, subcmd, result, options['filters'])
+    if options.get('max-items'):
+        result = paginate(result, options['max-items'], options.get('starting-token'))
+    if options.get('query'):
+        result = jmespath.search(options['query'], result)
+    print(json.dumps(result, indent=4))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
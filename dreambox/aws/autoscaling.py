@@ -1,13 +1,25 @@
 from __future__ import print_function
 import dreambox.aws.core as aws
-from funcy.strings import str_join
+from dreambox.aws.filters import ServerFilter
+from dreambox.aws.inventory import get_asg_inventory
+from dreambox.aws.regions import for_each
 from funcy.seqs import chunks
 from funcy.colls import select
-from itertools import chain
 import dreambox.aws.security
 import dreambox.utils
 import re
 import sys
+import threading
+import time
+
+# describe-auto-scaling-groups accepts up to 50 group names per call, and a
+# describe-instances filter up to 200 values
+MAX_NAMES_PER_CALL = 50
+MAX_INSTANCE_IDS_PER_CALL = 200
+
+# the Name tag of a play autoscaling group of an environment
+PLAY_ASG_PATTERN = r"{0}-(:?play_*|product_admin)"
+
 
 def get_all_asgs(ec2profile='',
                  ec2region='us-east-1',
@@ -32,6 +44,7 @@ this function will return a list of hashes upon a successful call
 def get_all_play_asgs(ec2profile=None,
                       ec2region='us-east-1',
                       env='production',
+                      incremental=False,
                       **options):
     '''
 get_play_asgs function will get all the play machine instances and store them
@@ -40,17 +53,14 @@ get_play_asgs function will get all the play machine instances and store them
   ec2profile: an ec2 profile stores in ~/.aws/config
   ec2region: a region we are working on
   env: environment we are looking for
+  incremental: use the shared AsgInventory of the profile and region, which
+    only re-describes the groups that changed since the last call
   **options: a list of options that can be accepted by
     autoscaling describe-auto-scaling-groups
     '''
-    qry = 'AutoScalingGroups[*].[Tags[?Key==`Name`].Value,Instances[].InstanceId][]'
-    hashes = dreambox.utils.make_hash_of_hashes(get_all_asgs(ec2profile,
-                                                             ec2region,
-                                                             query=qry))
+    hashes = __get_asgs_by_name_tag(ec2profile, ec2region, incremental)
     result = {}
-    regex_pattern = r"{0}-(:?play_*|product_admin)".format(env)
-    print("compiling regex pattern: {0}".format(regex_pattern), file=sys.stderr)
-    re_match = re.compile(regex_pattern, re.I)
+    re_match = dreambox.utils.compile_regex(PLAY_ASG_PATTERN.format(env), re.I)
     for k, v in hashes.items():
         if re_match.match(k) and '-db-' not in k:
             result[k.lower()] = v
@@ -58,9 +68,54 @@ get_play_asgs function will get all the play machine instances and store them
     return result
 
 
+def get_all_play_asgs_for_stages(ec2profile=None,
+                                 ec2region='us-east-1',
+                                 envs=None,
+                                 incremental=False):
+    '''
+get_all_play_asgs_for_stages works like get_all_play_asgs for many
+environments at once.  The groups are fetched once and matched against all
+the environments in a single pass.  This function takes the following
+parameters,
+
+  ec2profile: an ec2 profile stores in ~/.aws/config
+  ec2region: a region we are working on
+  envs: a list of environments we are looking for, i.e. stage1 ... stage9
+  incremental: see get_all_play_asgs
+
+this function returns { env: { name: [ instance id, ... ] } }
+    '''
+    envs = list(envs or [])
+    hashes = __get_asgs_by_name_tag(ec2profile, ec2region, incremental)
+    matcher = dreambox.utils.compile_multi_regex([PLAY_ASG_PATTERN.format(env) for env in envs], re.I)
+    env_of = dict(zip(matcher.patterns, envs))
+    result = dict((env, {}) for env in envs)
+    for k, v in hashes.items():
+        pattern = matcher.match(k)
+        if pattern is not None and '-db-' not in k:
+            result[env_of[pattern]][k.lower()] = v
+
+    return result
+
+
+def __get_asgs_by_name_tag(ec2profile=None, ec2region='us-east-1', incremental=False):
+    '''
+    return { Name tag: [ instance id, ... ] } for the autoscaling groups of a
+    region
+    '''
+    if incremental:
+        return get_asg_inventory(ec2profile or '', ec2region).refresh().by_name_tag()
+
+    qry = 'AutoScalingGroups[*].[Tags[?Key==`Name`].Value,Instances[].InstanceId][]'
+    return dreambox.utils.make_hash_of_hashes(get_all_asgs(ec2profile,
+                                                           ec2region,
+                                                           query=qry))
+
+
 def get_only_play_asgs(ec2profile='mgmt',
                        ec2region='us-east-1',
                        env='production',
+                       incremental=False,
                        **options):
     '''
 get_only_play_asgs will return all the play asg except _corn_ or _admin with
@@ -69,10 +124,12 @@ the group names. this function accepts the following parameters,
  ec2profile: a profile that is defined under ~/.aws/config
  ec2region: region in AWS this function works on
  env: what environment we are looking for
+ incremental: refresh a shared AsgInventory instead of describing every
+    group again; see get_all_play_asgs
  **options: a list of command line options that are applicable to
     autoscaling describe-auto-scaling-groups
     '''
-    all_play_asgs = get_all_play_asgs(ec2profile, ec2region, env, **options)
+    all_play_asgs = get_all_play_asgs(ec2profile, ec2region, env, incremental, **options)
     result = {}
     for k, v in all_play_asgs.items():
         if '_cron_' not in k.lower() and '_admin' not in k.lower():
@@ -81,30 +138,56 @@ the group names. this function accepts the following parameters,
 
 def get_ec2_instances_hostnames_from_asg_groups(ec2profile='',
                                                 ec2region='us-west-2',
-                                                asg_group={}):
+                                                asg_group={},
+                                                by_asg=False):
     '''
 get_ec2_instances_hostnames_from_asg_groups will get instance hostnames from
 a given ASG group.  This function takes the following parameters,
 
   ec2profile is profile defines in ~/.aws/config
   ec2region
+  asg_group is a hash of { asg name: [ instance id, ... ] }, i.e. what
+    get_only_play_asgs returns
+  by_asg returns the hostnames grouped by asg name when it is True
+
+the instance ids of all the groups are collected once, and described in
+batches of up to MAX_INSTANCE_IDS_PER_CALL ids, so a few describe-instances
+calls cover every group.  The ids are sent as an instance-id filter rather
+than --instance-ids, so an instance that was terminated meanwhile is left
+out instead of failing the whole batch with InvalidInstanceID.NotFound.
+This function returns a list of [ PublicDnsName, [ Name tag ] ] pairs, or
+{ asg name: [ pairs ] } when by_asg is True.
     '''
-    qry='Reservations[].[Instances[].[PublicDnsName,Tags[?Key==`Name`]]][][][]'
-    results = None
-    for k, v in asg_group.items():
-        if v:
-            ids = str_join(' ', v)
-            result = aws.ec2('describe-instances',
-                             profile=ec2profile,
-                             region=ec2region,
-                             instance_ids=ids,
-                             query=qry)
-            if result is not None:
-               results.append(result)
-    if results:
-        results = chunks(2, list(chain.from_iterable(results)))
-
-    return results
+    qry = 'Reservations[].Instances[].[InstanceId,PublicDnsName,Tags[?Key==`Name`]]'
+
+    # an instance id is described once, even if it shows up in many groups
+    instance_ids = []
+    seen = set()
+    for asg_name, ids in asg_group.items():
+        for instance_id in ids or []:
+            if instance_id not in seen:
+                seen.add(instance_id)
+                instance_ids.append(instance_id)
+
+    # index hostnames by instance id, so they can be mapped back to groups
+    hostnames = {}
+    for ids in chunks(MAX_INSTANCE_IDS_PER_CALL, instance_ids):
+        server_filter = ServerFilter('ec2', 'describe-instances')
+        server_filter.add('instance-id', ids)
+        result = aws.ec2('describe-instances',
+                         profile=ec2profile,
+                         region=ec2region,
+                         query=qry,
+                         **server_filter.options())
+        for instance_id, public_dns_name, tags in result or []:
+            hostnames[instance_id] = [public_dns_name, tags]
+
+    if by_asg:
+        return dict((asg_name, [hostnames[i] for i in ids or [] if i in hostnames])
+                    for asg_name, ids in asg_group.items())
+
+    results = [hostnames[i] for i in instance_ids if i in hostnames]
+    return results or None
 
 def get_all_autoscaling_group_from(profile='',
                                    region='',
@@ -134,32 +217,202 @@ given stage environment
     return return_result
 
 
+
+# how often wait_for_autoscaling_processes describes the groups, and how many
+# seconds it waits for them in total
+DEFAULT_POLL_INTERVAL = 5
+DEFAULT_WAIT_TIMEOUT = 300
+
+
+def get_suspended_processes(profile='',
+                            region=None,
+                            asg_names=None,
+                            verbose=False):
+    '''
+get_suspended_processes will return the suspended processes of a list of
+autoscaling groups as a hash of { asg name: [ process name, ... ] }.  The
+groups are described by name, MAX_NAMES_PER_CALL groups per call.  The
+function takes the following parameters,
+
+* profile: a profile that is defined under ~/.aws/config
+* region: region in AWS this function works on
+* asg_names: a list of autoscaling group names
+    '''
+    qry = 'AutoScalingGroups[].[AutoScalingGroupName,SuspendedProcesses[].ProcessName]'
+    result = {}
+    for names in chunks(MAX_NAMES_PER_CALL, list(asg_names or [])):
+        groups = aws.autoscaling('describe-auto-scaling-groups',
+                                 profile=profile,
+                                 region=region,
+                                 verbose=verbose,
+                                 auto_scaling_group_names=names,
+                                 query=qry)
+        for asg_name, processes in groups or []:
+            result[asg_name] = processes or []
+
+    return result
+
+
+def wait_for_autoscaling_processes(profile='',
+                                   region=None,
+                                   asg_names=None,
+                                   suspended=True,
+                                   timeout=DEFAULT_WAIT_TIMEOUT,
+                                   interval=DEFAULT_POLL_INTERVAL,
+                                   verbose=False):
+    '''
+wait_for_autoscaling_processes will poll a list of autoscaling groups until
+their processes are actually suspended (or resumed), or timeout seconds have
+passed.  Every poll describes all the groups still pending in batches.  The
+function takes the following parameters,
+
+* profile: a profile that is defined under ~/.aws/config
+* region: region in AWS this function works on
+* asg_names: a list of autoscaling group names
+* suspended: wait for suspended processes if True, resumed processes if False
+* timeout: how many seconds to wait in total
+* interval: how many seconds to sleep between polls
+
+this function returns a hash of { asg name: True|False }, False for a group
+that did not settle in time.
+    '''
+    pending = set(asg_names or [])
+    settled = dict((asg_name, False) for asg_name in pending)
+    deadline = time.time() + timeout
+    while pending:
+        # a cached describe would never change, so always ask AWS
+        cache = aws.get_cache()
+        if cache is not None:
+            cache.invalidate('autoscaling', profile, region)
+        processes = get_suspended_processes(profile=profile,
+                                            region=region,
+                                            asg_names=sorted(pending),
+                                            verbose=verbose)
+        for asg_name in list(pending):
+            if bool(processes.get(asg_name)) == suspended:
+                settled[asg_name] = True
+                pending.discard(asg_name)
+        if not pending or time.time() + interval > deadline:
+            break
+        time.sleep(interval)
+
+    return settled
+
+
+def __set_autoscaling_processes(subcmd=None,
+                                status=None,
+                                asg_groups=None,
+                                profile='',
+                                region=None,
+                                parallel=False,
+                                max_workers=None,
+                                wait=False,
+                                wait_timeout=DEFAULT_WAIT_TIMEOUT,
+                                progress=None,
+                                verbose=False,
+                                dry_run=False):
+    '''
+run suspend-processes or resume-processes for each autoscaling group, and
+return a list of { 'asg': name, 'status': status, 'seconds': latency }
+    '''
+    asg_groups = list(asg_groups or [])
+    lock = threading.Lock()
+    rows = {}
+
+    def set_processes(asg_group):
+        start = time.time()
+        try:
+            # suspend-processes and resume-processes take no --dry-run flag
+            if not dry_run:
+                aws.autoscaling(subcmd,
+                                profile=profile,
+                                region=region,
+                                verbose=verbose,
+                                auto_scaling_group_name=asg_group)
+            row_status = 'dry-run' if dry_run else status
+        except Exception as err:
+            row_status = 'failed: %s' % err
+        row = {'asg': asg_group, 'status': row_status, 'seconds': time.time() - start}
+        with lock:
+            rows[asg_group] = row
+            if progress is not None:
+                progress(row, len(rows), len(asg_groups))
+        return row
+
+    for_each(set_processes,
+             asg_groups,
+             max_workers=max_workers if parallel else 1)
+
+    done = [asg_group for asg_group in asg_groups if rows[asg_group]['status'] == status]
+    if wait and done:
+        settled = wait_for_autoscaling_processes(profile=profile,
+                                                 region=region,
+                                                 asg_names=done,
+                                                 suspended=subcmd == 'suspend-processes',
+                                                 timeout=wait_timeout,
+                                                 verbose=verbose)
+        for asg_group, ok in settled.items():
+            if not ok:
+                rows[asg_group]['status'] = 'timed out waiting to be %s' % status
+
+    return [rows[asg_group] for asg_group in asg_groups]
+
+
 def suspend_autoscaling_groups_for_stage(profile='',
                                          region=None,
                                          filterby=None,
                                          verbose=False,
-                                         dry_run=False):
+                                         dry_run=False,
+                                         parallel=False,
+                                         max_workers=None,
+                                         wait=False,
+                                         wait_timeout=DEFAULT_WAIT_TIMEOUT,
+                                         progress=None):
     '''
 suspend_autoscaling_groups_for_stage will suspend autoscaling groups bsaed on
-a filterby parameter.  This function returns nothing.
+a filterby parameter.  The function takes the following parameters,
+
+* profile: a profile that is defined under ~/.aws/config
+* region: region in AWS this function works on
+* filterby: a stage enviornment to look for
+* parallel: suspend the groups concurrently instead of one by one
+* max_workers: how many groups are suspended at the same time in parallel
+  mode.  If it is None, dreambox.aws.regions.DEFAULT_MAX_WORKERS is used
+* wait: poll the groups until their processes are actually suspended
+* wait_timeout: how many seconds to wait for the groups
+* progress: an optional function called as progress(row, done, total) each
+  time a group is done
+
+this function returns a list of { 'asg': name, 'status': status, 'seconds':
+latency }, one per group.
     '''
     asg_groups = get_all_autoscaling_group_from(profile=profile,
                                                 region=region,
                                                 filterby=filterby)
-    for asg_group in asg_groups:
-        aws.autoscaling('suspend-processes',
-                        profile=profile,
-                        region=region,
-                        auto_scaling_group_name=asg_group,
-                        verbose=verbose,
-                        dry_run=dry_run)
+    return __set_autoscaling_processes('suspend-processes',
+                                       'suspended',
+                                       asg_groups,
+                                       profile=profile,
+                                       region=region,
+                                       parallel=parallel,
+                                       max_workers=max_workers,
+                                       wait=wait,
+                                       wait_timeout=wait_timeout,
+                                       progress=progress,
+                                       verbose=verbose,
+                                       dry_run=dry_run)
 
 
 def resume_autoscaling_group_for_stage(profile='',
                                        region='us-west-2',
                                        stage=None,
                                        verbose=True,
-                                       dry_run=False):
+                                       dry_run=False,
+                                       parallel=False,
+                                       max_workers=None,
+                                       wait=False,
+                                       wait_timeout=DEFAULT_WAIT_TIMEOUT,
+                                       progress=None):
     '''
 resume_autoscaling_group_for_stage is a function that resume a suspend autoscaling
 groups for a given stage environment.  The function takes the following parameters,
@@ -167,20 +420,29 @@ groups for a given stage environment.  The function takes the following paramete
 * 2profile: a profile that is defined under ~/.aws/config
 * 2region: region in AWS this function works on
 * stage: a stage enviornment to look for
+* parallel, max_workers, wait, wait_timeout and progress work the same way
+  as suspend_autoscaling_groups_for_stage
+
+this function returns a list of { 'asg': name, 'status': status, 'seconds':
+latency }, one per group.
     '''
     asg_groups = get_all_autoscaling_group_from(profile=profile,
                                                 region=region,
                                                 filterby=stage)
     if verbose:
       dreambox.utils.print_structure(asg_groups)
-    if asg_groups:
-        for asg_group in asg_groups:
-           aws.autoscaling('resume-processes',
-                           profile=profile,
-                           region=region,
-                           verbose=verbose,
-                           dry_run=dry_run,
-                           auto_scaling_group=asg_group)
+    return __set_autoscaling_processes('resume-processes',
+                                       'resumed',
+                                       asg_groups,
+                                       profile=profile,
+                                       region=region,
+                                       parallel=parallel,
+                                       max_workers=max_workers,
+                                       wait=wait,
+                                       wait_timeout=wait_timeout,
+                                       progress=progress,
+                                       verbose=verbose,
+                                       dry_run=dry_run)
 
 if __name__ == '__main__':
 
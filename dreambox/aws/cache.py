@@ -0,0 +1,162 @@
+from __future__ import print_function
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# sub-commands whose results can be cached, and sub-commands that change
+# resources.  A mutating sub-command drops the cached results of the same
+# command, profile and region.
+READ_ONLY_PREFIXES = ('describe-', 'list-', 'get-')
+MUTATING_PREFIXES = ('revoke-', 'authorize-', 'delete-', 'create-', 'suspend-',
+                     'resume-', 'put-', 'modify-', 'update-', 'attach-', 'detach-',
+                     'set-', 'terminate-', 'run-', 'start-', 'stop-', 'reboot-')
+
+
+def is_read_only(subcmd=None):
+    return subcmd is not None and subcmd.startswith(READ_ONLY_PREFIXES)
+
+
+def is_mutating(subcmd=None):
+    return subcmd is not None and subcmd.startswith(MUTATING_PREFIXES)
+
+
+class ResponseCache(object):
+    '''
+ResponseCache keeps the results of read-only aws calls for a while, so the
+same describe-* call issued twice within one run only reaches AWS once.  The
+constructor takes these parameters,
+
+* ttl is how many seconds a result stays valid
+* maxsize is how many results are kept in memory; the least recently used
+  result is evicted first
+* path is an optional directory.  When it is set, results are also written
+  there, so back-to-back invocations of a script share them
+
+results are keyed on (cmd, subcmd, profile, region, query, options), and are
+stored as json text, so every hit returns a fresh copy the caller can modify.
+    '''
+
+    def __init__(self, ttl=300, maxsize=1024, path=None):
+        self.ttl     = ttl
+        self.maxsize = maxsize
+        self.path    = os.path.expanduser(path) if path else None
+        self._lock   = threading.Lock()
+        self._items  = OrderedDict()
+        self.hits    = 0
+        self.misses  = 0
+        if self.path and not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    @staticmethod
+    def key(cmd=None, subcmd=None, **kwargs):
+        '''
+        return the cache key for an aws call as a string
+        '''
+        profile = kwargs.pop('profile', None) or ''
+        region  = kwargs.pop('region', None) or ''
+        query   = kwargs.pop('query', None) or ''
+        return json.dumps([cmd, subcmd, profile, region, query, sorted(kwargs.items())])
+
+    @staticmethod
+    def _scope(cmd=None, profile=None, region=None):
+        return hashlib.sha1(json.dumps([cmd, profile or '', region or '']).encode('utf-8')).hexdigest()
+
+    def _filename(self, key):
+        cmd, _, profile, region = json.loads(key)[0:4]
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, '%s-%s.json' % (self._scope(cmd, profile, region), digest))
+
+    def get(self, key):
+        '''
+        return (True, value) if key is cached and not expired, otherwise
+        (False, None)
+        '''
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                if item[0] > now:
+                    # move the key to the end, it is the most recently used
+                    del self._items[key]
+                    self._items[key] = item
+                    self.hits += 1
+                    return True, json.loads(item[1])
+                del self._items[key]
+
+        if self.path:
+            filename = self._filename(key)
+            try:
+                with open(filename, 'r') as fh:
+                    expires, text = json.load(fh)
+            except (IOError, OSError, ValueError):
+                expires, text = 0, None
+            if expires > now:
+                self._remember(key, expires, text)
+                with self._lock:
+                    self.hits += 1
+                return True, json.loads(text)
+
+        with self._lock:
+            self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        '''
+        store a value for a key
+        '''
+        expires = time.time() + self.ttl
+        text    = json.dumps(value)
+        self._remember(key, expires, text)
+        if self.path:
+            filename = self._filename(key)
+            # write to a temporary file and rename it, so a concurrent reader
+            # never sees a half written file
+            fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fh:
+                json.dump([expires, text], fh)
+            os.rename(tmpname, filename)
+
+    def _remember(self, key, expires, text):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (expires, text)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, cmd=None, profile=None, region=None):
+        '''
+        drop every cached result for a given command, profile and region
+        '''
+        scope = [cmd, profile or '', region or '']
+        with self._lock:
+            for key in list(self._items):
+                parts = json.loads(key)
+                if [parts[0]] + parts[2:4] == scope:
+                    del self._items[key]
+
+        if self.path:
+            prefix = self._scope(cmd, profile, region) + '-'
+            for filename in os.listdir(self.path):
+                if filename.startswith(prefix):
+                    try:
+                        os.unlink(os.path.join(self.path, filename))
+                    except OSError:
+                        pass
+
+    def clear(self):
+        '''
+        drop every cached result
+        '''
+        with self._lock:
+            self._items.clear()
+        if self.path:
+            for filename in os.listdir(self.path):
+                if filename.endswith('.json'):
+                    try:
+                        os.unlink(os.path.join(self.path, filename))
+                    except OSError:
+                        pass
@@ -1,9 +1,22 @@
 from __future__ import print_function
 import dreambox.aws.core as aws
+from dreambox.aws.regions import for_each, for_each_region
 from funcy.colls import select
 import dreambox.utils
 import re
 import sys
+import time
+
+# how many seconds tail_stack_events sleeps between polls
+DEFAULT_TAIL_INTERVAL = 5
+
+# statuses a stack settles in; anything else is still in progress
+STACK_DONE_SUFFIXES = ('_COMPLETE', '_FAILED')
+
+# how many seconds create_stacks waits between describe-stacks polls; the
+# interval grows while no stack changes
+MIN_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 30
 
 
 def get_stack_names_from_all_regions(profile='',
@@ -20,22 +33,20 @@ function accepts 3 parameters,
   qry: a json query string
 
 get_stack_names_from_all_regions will only return name with stageN (n is a
-number from 1 - 9)
+number, i.e. stage3 or stage12)
     '''
     if regions is None:
         regions = ['us-east-1', 'us-west-2']
 
-    region_stacks = {}
-    m = re.compile(r'^stage\d$', re.IGNORECASE)
-    for region in regions:
-        region_stack = [r for r in aws.cloudformation('describe-stacks',
-                                                      profile=profile,
-                                                      region=region,
-                                                      query=qry)
-                        if m.match(r)]
-        region_stacks[region] = region_stack
+    m = dreambox.utils.compile_regex(r'^stage\d+$', re.IGNORECASE)
+    def get_region_stacks(region):
+        return [r for r in aws.cloudformation('describe-stacks',
+                                              profile=profile,
+                                              region=region,
+                                              query=qry)
+                if m.match(r)]
 
-    return region_stacks
+    return for_each_region(get_region_stacks, regions)
 
 
 def get_all_stacks_for_stage(profile='',
@@ -82,7 +93,7 @@ for
     return stack_events
 
 
-def get_all_stackevents_for_stage(profile='', region=None, filterby=None):
+def get_all_stackevents_for_stage(profile='', region=None, filterby=None, max_workers=None):
     '''
 get_all_stackevents_for_stage will collect all cloudformation stack events for a
 given stage environment.  The function takes the following parameters,
@@ -93,16 +104,134 @@ profile in ~/.aws/config or IAM profile for a node
 region is an AWS region that this function will work on
 
 filterby is a stage environment name, i.e. stage1 ... stage9
+
+max_workers is how many stacks are queried at the same time
+
+the function returns a hash of { stack name: [ events ] }
     '''
 
     stack_names = get_all_stacks_for_stage(profile=profile,
                                            region=region,
                                            filterby=filterby)
-    stacks_events = {}
-    for stack_name in stack_names:
-        stacks_events['stack_name'] = get_stack_events(profile=profile,
-                                                       region=region,
-                                                       stack_name=stack_name)
+    def get_events(stack_name):
+        return get_stack_events(profile=profile,
+                                region=region,
+                                stack_name=stack_name)
+
+    return for_each(get_events, stack_names, max_workers=max_workers)
+
+
+def get_new_stack_events(profile=None, region=None, stack_name=None, last_event_id=None):
+    '''
+get_new_stack_events returns the events of a stack that are newer than a
+given event, oldest first.  AWS returns events newest first, so pages are
+fetched one at a time and paging stops as soon as last_event_id shows up.
+This function takes the following parameters,
+
+profile is an aws profile if one is provide; otherwise looking for default
+profile in ~/.aws/config or IAM profile for a node
+
+region is an AWS region that this function will work on
+
+stack_name is a name of stack
+
+last_event_id is the EventId of the newest event already seen.  If it is
+None, only the most recent page of events is returned
+    '''
+    events = []
+    for page in aws.iter_pages('cloudformation',
+                               'describe-stack-events',
+                               page_size=None,
+                               profile=profile,
+                               region=region,
+                               stack_name=stack_name):
+        done = last_event_id is None
+        for event in page.get('StackEvents', []):
+            if event['EventId'] == last_event_id:
+                done = True
+                break
+            events.append(event)
+        if done:
+            break
+
+    events.reverse()
+    return events
+
+
+def tail_stack_events(profile='',
+                      region=None,
+                      filterby=None,
+                      stack_names=None,
+                      interval=DEFAULT_TAIL_INTERVAL,
+                      polls=None,
+                      until_complete=False,
+                      max_workers=None):
+    '''
+tail_stack_events is a generator that follows the events of many stacks, i.e.
+all the stacks of a stage while it deploys, and yields them as one stream in
+time order.  Every poll queries the stacks concurrently, and only downloads
+the events that are new since the last poll.  The function takes the
+following parameters,
+
+profile is an aws profile if one is provide; otherwise looking for default
+profile in ~/.aws/config or IAM profile for a node
+
+region is an AWS region that this function will work on
+
+filterby is a stage environment name, used when stack_names is None
+
+stack_names is a list of stacks to follow
+
+interval is how many seconds to sleep between polls
+
+polls is how many polls to make; None polls until stopped
+
+until_complete stops once every stack has reached a *_COMPLETE or *_FAILED
+status
+
+max_workers is how many stacks are queried at the same time
+    '''
+    if stack_names is None:
+        stack_names = get_all_stacks_for_stage(profile=profile,
+                                               region=region,
+                                               filterby=filterby) or []
+    stack_names = list(stack_names)
+
+    last_event_ids = {}
+    stack_statuses = {}
+    poll = 0
+    while stack_names:
+        # cached describe-stack-events results would never change
+        cache = aws.get_cache()
+        if cache is not None:
+            cache.invalidate('cloudformation', profile, region)
+
+        def get_events(stack_name):
+            return get_new_stack_events(profile=profile,
+                                        region=region,
+                                        stack_name=stack_name,
+                                        last_event_id=last_event_ids.get(stack_name))
+
+        new_events = []
+        for stack_name, events in for_each(get_events, stack_names, max_workers=max_workers).items():
+            if events:
+                last_event_ids[stack_name] = events[-1]['EventId']
+                new_events.extend(events)
+            for event in events:
+                if event.get('ResourceType') == 'AWS::CloudFormation::Stack' and \
+                   event.get('LogicalResourceId') == stack_name:
+                    stack_statuses[stack_name] = event.get('ResourceStatus', '')
+
+        for event in sorted(new_events, key=lambda e: (e['Timestamp'], e['StackName'])):
+            yield event
+
+        poll += 1
+        if polls is not None and poll >= polls:
+            return
+        if until_complete and all(stack_statuses.get(stack_name, '').endswith(STACK_DONE_SUFFIXES)
+                                  for stack_name in stack_names):
+            return
+        time.sleep(interval)
 
 
 def get_cloudformation_stack_info(profile='', regions=None, environ=None, dry_run=False):
@@ -182,6 +311,224 @@ The function return stackId upon success
     return stack_id
 
 
+
+def __stack_waves(stacks=None):
+    '''
+    check a stack dependency graph, and return its stacks in waves: every
+    stack of a wave only depends on stacks of earlier waves.  An exception is
+    raised for an unknown dependency or a cycle.
+    '''
+    depends_on = {}
+    for stack_name, definition in stacks.items():
+        depends_on[stack_name] = set(definition.get('depends_on') or [])
+        unknown = depends_on[stack_name] - set(stacks)
+        if unknown:
+            raise Exception('stack %s depends on unknown stacks %s' % (stack_name, ', '.join(sorted(unknown))))
+
+    waves = []
+    placed = set()
+    while len(placed) < len(stacks):
+        wave = sorted(stack_name for stack_name in stacks
+                      if stack_name not in placed and depends_on[stack_name] <= placed)
+        if not wave:
+            raise Exception('stacks %s depend on each other' %
+                            ', '.join(sorted(set(stacks) - placed)))
+        waves.append(wave)
+        placed.update(wave)
+    return waves
+
+
+def critical_path(stacks=None, results=None):
+    '''
+critical_path returns the chain of stacks that decided how long create_stacks
+took: starting from the stack that finished last, it follows the dependency
+that finished last, back to a stack without dependencies.  The function takes
+these parameters,
+
+* stacks is the dependency graph given to create_stacks
+* results is what create_stacks returned
+
+the path is returned first stack first.
+    '''
+    finished = [(result['finished'], stack_name) for stack_name, result in results.items()
+                if result.get('finished') is not None]
+    if not finished:
+        return []
+
+    path = [max(finished)[1]]
+    while True:
+        dependencies = [(results[dependency]['finished'], dependency)
+                        for dependency in stacks[path[-1]].get('depends_on') or []
+                        if results.get(dependency, {}).get('finished') is not None]
+        if not dependencies:
+            break
+        path.append(max(dependencies)[1])
+
+    path.reverse()
+    return path
+
+
+def print_stacks_report(stacks=None, results=None):
+    '''
+print_stacks_report prints how long each stack of create_stacks took, and the
+critical path with the time each stack on it waited for its dependencies.
+    '''
+    started = [result['started'] for result in results.values() if result.get('started') is not None]
+    if not started:
+        return
+    begin = min(started)
+
+    print('{0:<40} {1:<24} {2:>10} {3:>10}'.format('stack', 'status', 'start', 'seconds'), file=sys.stderr)
+    for stack_name in sorted(results, key=lambda name: (results[name].get('started') or 0, name)):
+        result = results[stack_name]
+        started = result.get('started')
+        print('{0:<40} {1:<24} {2:>10} {3:>10}'.format(
+            stack_name,
+            result['status'],
+            '%.1f' % (started - begin) if started is not None else '-',
+            '%.1f' % result['seconds'] if result.get('seconds') is not None else '-'), file=sys.stderr)
+
+    path = critical_path(stacks, results)
+    if path:
+        total = results[path[-1]]['finished'] - begin
+        print('critical path: %.1fs' % total, file=sys.stderr)
+        ready = begin
+        for stack_name in path:
+            result = results[stack_name]
+            print('  {0:<40} waited {1:>7.1f}s  created in {2:>7.1f}s'.format(
+                stack_name, result['started'] - ready, result['seconds']), file=sys.stderr)
+            ready = result['finished']
+
+
+def create_stacks(profile='',
+                  region=None,
+                  stacks=None,
+                  max_workers=None,
+                  timeout=None,
+                  dry_run=False,
+                  verbose=False):
+    '''
+create_stacks will create many cloudformation stacks that depend on each
+other, i.e. all the stacks of a stage.  A stack is created as soon as the
+stacks it depends on are complete, so independent stacks are created in
+parallel.  All the stacks being created are watched with a single
+describe-stacks call per poll; the poll interval grows from MIN_POLL_INTERVAL
+to MAX_POLL_INTERVAL while nothing changes, and drops back when a stack
+settles.  This function takes the following parameters,
+
+* profile is an aws profile if one is provide; otherwise looking for default
+  profile in ~/.aws/config or IAM profile for a node
+* region is an AWS region that this function will work on
+* stacks is a hash of { stack name: { 'depends_on': [ stack name, ... ],
+  create-stack options ... } }.  The options are the same as create_stack
+  takes, without stack_name
+* max_workers is how many create-stack calls are made at the same time
+* timeout is how many seconds to wait for all the stacks; None waits forever
+* dry_run prints the order the stacks would be created in, without creating
+  anything
+* verbose prints every aws command executed
+
+the function returns { stack name: { 'status': ..., 'started': epoch,
+'finished': epoch, 'seconds': ... } }.  A stack is done once its status ends
+in _COMPLETE or _FAILED; anything but CREATE_COMPLETE, i.e. ROLLBACK_COMPLETE,
+is a failure.  A stack that create-stack did not return a StackId for, or
+that describe-stacks does not list, gets a FAILED status, and a stack whose
+dependency failed gets the status SKIPPED.  A timing report with the
+critical path is printed to stderr at the end.
+    '''
+    stacks = stacks or {}
+    waves = __stack_waves(stacks)
+    if dry_run:
+        for number, wave in enumerate(waves):
+            print('wave %d: %s' % (number + 1, ', '.join(wave)), file=sys.stderr)
+        return dict((stack_name, {'status': 'dry-run'}) for stack_name in stacks)
+
+    results = dict((stack_name, {'status': 'PENDING'}) for stack_name in stacks)
+    creating = set()
+    deadline = time.time() + timeout if timeout is not None else None
+    interval = MIN_POLL_INTERVAL
+
+    def status_of(stack_name):
+        return results[stack_name]['status']
+
+    def create(stack_name):
+        options = dict((key, value) for key, value in stacks[stack_name].items() if key != 'depends_on')
+        result = create_stack(profile=profile,
+                              region=region,
+                              verbose=verbose,
+                              stack_name=stack_name,
+                              **options)
+        # awscli errors other than throttling come back as no output
+        if not result or 'StackId' not in result:
+            raise Exception('create-stack returned no StackId')
+
+    def finish(stack_name, status):
+        result = results[stack_name]
+        result['status'] = status
+        result['finished'] = time.time()
+        result['seconds'] = result['finished'] - result['started']
+        creating.discard(stack_name)
+
+    while True:
+        # a failed stack takes down everything that depends on it; waves are
+        # in dependency order, so a whole chain is skipped in one pass.  Any
+        # status but these counts as failed, i.e. ROLLBACK_IN_PROGRESS while
+        # the stack is still being watched
+        for stack_name in [name for wave in waves for name in wave]:
+            if status_of(stack_name) == 'PENDING' and \
+               any(status_of(dependency) not in ('PENDING', 'CREATE_IN_PROGRESS', 'CREATE_COMPLETE')
+                   for dependency in stacks[stack_name].get('depends_on') or []):
+                results[stack_name]['status'] = 'SKIPPED'
+
+        ready = [stack_name for stack_name in sorted(stacks)
+                 if status_of(stack_name) == 'PENDING' and
+                 all(status_of(dependency) == 'CREATE_COMPLETE'
+                     for dependency in stacks[stack_name].get('depends_on') or [])]
+        if ready:
+            for stack_name in ready:
+                results[stack_name].update({'status': 'CREATE_IN_PROGRESS', 'started': time.time()})
+                creating.add(stack_name)
+            errors = {}
+            for_each(create, ready, max_workers=max_workers, errors=errors)
+            for stack_name, err in errors.items():
+                finish(stack_name, 'FAILED: %s' % err)
+            interval = MIN_POLL_INTERVAL
+            continue
+
+        if not creating:
+            break
+        if deadline is not None and time.time() >= deadline:
+            for stack_name in list(creating):
+                finish(stack_name, 'TIMED_OUT')
+            continue
+
+        time.sleep(interval)
+        cache = aws.get_cache()
+        if cache is not None:
+            cache.invalidate('cloudformation', profile, region)
+        statuses = dict(aws.cloudformation('describe-stacks',
+                                           profile=profile,
+                                           region=region,
+                                           query='Stacks[].[StackName,StackStatus]') or [])
+        changed = False
+        for stack_name in list(creating):
+            status = statuses.get(stack_name)
+            if status is None:
+                # the stack is gone, or was never created
+                finish(stack_name, 'FAILED: stack not found')
+                changed = True
+            elif status.endswith(STACK_DONE_SUFFIXES):
+                finish(stack_name, status)
+                changed = True
+            elif status != status_of(stack_name):
+                # i.e. ROLLBACK_IN_PROGRESS; keep watching until it settles
+                results[stack_name]['status'] = status
+                changed = True
+        interval = MIN_POLL_INTERVAL if changed else min(MAX_POLL_INTERVAL, interval * 1.5)
+
+    print_stacks_report(stacks, results)
+    return results
+
 if __name__ == '__main__':
     stacks = get_all_stacks_for_stage(region='us-west-2', filterby='stage3')
     dreambox.utils.print_structure(stacks)
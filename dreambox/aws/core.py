@@ -1,16 +1,482 @@
 from __future__ import print_function
 import json
 import dreambox.utils
+from dreambox.aws.cache import ResponseCache, is_read_only, is_mutating
+from dreambox.aws.throttle import RateLimiter, is_throttling_error
 import sh
 from sh import aws
+import os
 import sys
 
+# python 3 does not have basestring
+try:
+    basestring
+except NameError:
+    basestring = str
+
 # a custom error message to handle when aws cli command not taking
 # --dry-run option
 class DryRunError(sh.ErrorReturnCode):
     def __init__(self, message):
         super(sh.ErrorReturnCode, self).__init__(message)
 
+class CliBackend(object):
+    '''
+CliBackend executes an aws command by spawning the awscli command line tool
+through sh.  This is the default backend of __aws.
+    '''
+    name = 'cli'
+
+    # how many items iter_pages asks for per awscli call when page_size is
+    # None, for commands that have no --page-size (i.e. describe-stack-events)
+    max_items = 100
+
+    def __call__(self, cmd=None, subcmd=None, verbose=False, strict=False, **kwargs):
+        aws_func = None
+        output = None
+
+        # check if a given cmd is support by aws; raise an excpetion
+        # if not
+        if hasattr(aws, cmd):
+            aws_func = getattr(aws, cmd)
+        else:
+          raise Exception('cmd %s is not support by awscli' % cmd)
+
+        # a list value is passed as separate arguments the way awscli expects
+        # them, i.e. --auto-scaling-group-names asg1 asg2
+        args = [subcmd]
+        options = dict(kwargs)
+        for key in [k for k, v in options.items() if isinstance(v, (list, tuple))]:
+            args.append('--%s' % key.replace('_', '-'))
+            args.extend(str(value) for value in options.pop(key))
+
+        func = aws_func.bake(*args, **options)
+        full_function_args =  func._path + ' ' + ' '.join(func._partial_baked_args)
+        if verbose:
+           dreambox.utils.print_structure(kwargs)
+           print('executing %s' % full_function_args)
+
+        # execute awscli command, and check if there's any output available
+        # some awscli command will not accept --dry-run flag, so we raise our
+        # custom exception to allow caller to capture and handle it.
+        try:
+            output = func()
+        except sh.ErrorReturnCode_255 as err:
+            if '--dry-run' in str(err.stderr):
+                raise DryRunError(full_function_args)
+            # let the rate limiter see throttling errors, so it can retry
+            if strict or is_throttling_error(err):
+                raise
+        except sh.ErrorReturnCode:
+            raise
+
+        json_obj = None
+        if output and output.stdout:
+           json_obj = json.loads(output.stdout)
+
+        return json_obj
+
+    def iter_pages(self, cmd=None, subcmd=None, page_size=1000, verbose=False, **kwargs):
+        '''
+        yield the pages of a command one at a time.  Each page is fetched
+        by its own awscli call with --max-items and --starting-token, so only
+        one page is held in memory.
+        '''
+        token = None
+        while True:
+            options = dict(kwargs)
+            options['max_items'] = page_size or self.max_items
+            if page_size:
+                options['page_size'] = page_size
+            if token:
+                options['starting_token'] = token
+            page = self(cmd, subcmd, verbose=verbose, **options)
+            if page is None:
+                return
+            token = page.pop('NextToken', None)
+            yield page
+            if not token:
+                return
+
+
+class Boto3Backend(object):
+    '''
+Boto3Backend executes an aws command in process through a long-lived boto3
+session instead of forking awscli.  The backend takes the same cmd, subcmd
+and **kwargs as awscli does,
+
+* cmd is an awscli command; s3api maps to the boto3 s3 client
+* subcmd is an awscli sub-command, i.e. describe-instances
+* **kwargs are awscli options, i.e. instance_ids='i-1 i-2'.  Options are
+  matched against the operation input shape, and values are converted
+  from awscli form (space separated lists, shorthand or json strings) into
+  the types boto3 expects
+
+sessions and clients are cached per (profile, region) and reused for the
+life of the process.  query is evaluated with jmespath, and the result is
+round-tripped through json so callers get the same objects awscli returns.
+    '''
+    name = 'boto3'
+
+    # awscli commands whose boto3 service name is different
+    service_names = {
+        's3api': 's3',
+        'configservice': 'config',
+    }
+
+    # awscli pagination options; they are handled by a boto3 paginator
+    # instead of being passed to the operation
+    paginator_options = {
+        'max_items': 'MaxItems',
+        'starting_token': 'StartingToken',
+        'page_size': 'PageSize',
+    }
+
+    # api options that page by hand; when one of them is given, awscli (and
+    # this backend) makes a single request instead of fetching every page
+    pagination_options = ('max_records', 'marker', 'next_token')
+
+    def __init__(self):
+        import botocore.exceptions
+        import jmespath
+        from dreambox.boto3.ClientPool import pool
+        self._pool       = pool
+        self._exceptions = botocore.exceptions
+        self._jmespath   = jmespath
+
+    def session(self, profile=None):
+        '''
+        return the shared boto3 session for a given profile.  An empty profile
+        uses the default credential chain.
+        '''
+        return self._pool.session(profile)
+
+    def client(self, cmd=None, profile=None, region=None):
+        '''
+        return a shared boto3 client for a given awscli command, profile and
+        region.  Clients come from the same pool dreambox.boto3 objects use.
+        '''
+        service = self.service_names.get(cmd, cmd)
+        return self._pool.client(service, region, profile)
+
+    def _prepare(self, cmd=None, subcmd=None, verbose=False, **kwargs):
+        '''
+        translate an awscli command into a boto3 client, operation name,
+        operation parameters and paginator config
+        '''
+        profile = kwargs.pop('profile', None)
+        region  = kwargs.pop('region', None)
+        dry_run = kwargs.pop('dry_run', False)
+        kwargs.pop('output', None)
+
+        pagination_config = {}
+        for option, name in self.paginator_options.items():
+            if option in kwargs:
+                pagination_config[name] = kwargs.pop(option)
+
+        try:
+            client = self.client(cmd, profile, region)
+        except self._exceptions.UnknownServiceError:
+            raise Exception('cmd %s is not support by awscli' % cmd)
+
+        operation = subcmd.replace('-', '_')
+        if not hasattr(client, operation):
+            raise Exception('subcmd %s is not support by %s' % (subcmd, cmd))
+        operation_model = client.meta.service_model.operation_model(
+            client.meta.method_to_api_mapping[operation])
+        input_shape = operation_model.input_shape
+        members = input_shape.members if input_shape is not None else {}
+
+        params = _cli_shorthand_params(cmd, subcmd, kwargs)
+        for option, value in kwargs.items():
+            member = _find_member(members, option)
+            if member is None:
+                raise Exception('option %s is not support by %s %s' % (option, cmd, subcmd))
+            params[member] = _coerce_to_shape(members[member], value)
+
+        full_function_args = 'boto3 %s.%s(%s)' % (cmd, operation, params)
+        if dry_run:
+            if 'DryRun' not in members:
+                raise DryRunError(full_function_args)
+            params['DryRun'] = True
+
+        if verbose:
+           dreambox.utils.print_structure(params)
+           print('executing %s' % full_function_args)
+
+        paginate = client.can_paginate(operation) and not \
+            any(option in kwargs for option in self.pagination_options)
+
+        return client, operation, params, pagination_config if paginate else None, full_function_args
+
+    def _to_json(self, result, query=None):
+        result.pop('ResponseMetadata', None)
+        if not result:
+            return None
+
+        # round trip through json, so timestamps become strings the same
+        # way awscli prints them
+        json_obj = json.loads(json.dumps(result, default=_json_default))
+        if query:
+            json_obj = self._jmespath.search(query, json_obj)
+
+        return json_obj
+
+    def __call__(self, cmd=None, subcmd=None, verbose=False, strict=False, **kwargs):
+        # a failed call always raises here, so strict changes nothing
+        query = kwargs.pop('query', None)
+        client, operation, params, pagination_config, full_function_args = \
+            self._prepare(cmd, subcmd, verbose, **kwargs)
+
+        try:
+            if pagination_config is not None:
+                paginator = client.get_paginator(operation)
+                result = paginator.paginate(PaginationConfig=pagination_config,
+                                            **params).build_full_result()
+            else:
+                result = getattr(client, operation)(**params)
+        except self._exceptions.ClientError as err:
+            if err.response.get('Error', {}).get('Code') == 'DryRunOperation':
+                print('--dry-run flag set, executing %s' % full_function_args)
+                return None
+            raise
+
+        return self._to_json(result, query)
+
+    def iter_pages(self, cmd=None, subcmd=None, page_size=None, verbose=False, **kwargs):
+        '''
+        yield the pages of a command one at a time through a boto3
+        paginator.  Commands that cannot be paginated yield one page.
+        '''
+        if page_size:
+            kwargs['page_size'] = page_size
+        client, operation, params, pagination_config, full_function_args = \
+            self._prepare(cmd, subcmd, verbose, **kwargs)
+
+        if pagination_config is None:
+            yield self._to_json(getattr(client, operation)(**params))
+            return
+
+        paginator = client.get_paginator(operation)
+        for page in paginator.paginate(PaginationConfig=pagination_config, **params):
+            yield self._to_json(page)
+
+
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'read'):
+        return value.read()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _find_member(members, option):
+    '''
+    find an input shape member for an awscli option.  Like awscli (argparse),
+    an unambiguous prefix of an option is accepted.
+    '''
+    from botocore import xform_name
+    options = dict((xform_name(name), name) for name in members)
+    if option in options:
+        return options[option]
+    candidates = [name for opt, name in options.items() if opt.startswith(option)]
+    if len(candidates) == 1:
+        return candidates[0]
+    return None
+
+
+def _coerce_to_shape(shape, value):
+    '''
+    convert an awscli style option value into what a botocore shape expects
+    '''
+    type_name = shape.type_name
+    if isinstance(value, basestring) and type_name in ('structure', 'list', 'map'):
+        value = value.strip()
+        if value[:1] in ('[', '{'):
+            value = json.loads(value)
+        elif type_name == 'list':
+            value = value.split()
+        else:
+            from awscli.shorthand import ShorthandParser
+            value = ShorthandParser().parse(value)
+
+    if type_name == 'structure' and isinstance(value, dict):
+        return dict((k, _coerce_to_shape(shape.members[k], v) if k in shape.members else v)
+                    for k, v in value.items())
+    elif type_name == 'list':
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        member = shape.member
+        if member.type_name == 'structure':
+            from awscli.shorthand import ShorthandParser
+            value = [ShorthandParser().parse(v) if isinstance(v, basestring) else v
+                     for v in value]
+        return [_coerce_to_shape(member, v) for v in value]
+    elif type_name == 'map' and isinstance(value, dict):
+        return dict((k, _coerce_to_shape(shape.value, v)) for k, v in value.items())
+    elif type_name in ('integer', 'long'):
+        return int(value)
+    elif type_name in ('float', 'double'):
+        return float(value)
+    elif type_name == 'boolean':
+        return dreambox.utils.to_bool(value)
+    return value
+
+
+def _cli_shorthand_params(cmd=None, subcmd=None, kwargs=None):
+    '''
+    a few awscli sub-commands take options that only exist in awscli, and
+    are not part of the aws api.  This function translates the ones we use,
+    and removes them from kwargs.
+    '''
+    params = {}
+    if cmd == 'ec2' and subcmd in ('revoke-security-group-ingress',
+                                   'authorize-security-group-ingress',
+                                   'revoke-security-group-egress',
+                                   'authorize-security-group-egress'):
+        if 'protocol' in kwargs or 'port' in kwargs:
+            protocol = str(kwargs.pop('protocol', '-1'))
+            permission = {'IpProtocol': protocol}
+            port = kwargs.pop('port', None)
+            if port is not None and protocol not in ('-1', 'all'):
+                ports = str(port).split('-', 1)
+                permission['FromPort'] = int(ports[0])
+                permission['ToPort'] = int(ports[-1])
+            cidr = kwargs.pop('cidr', None)
+            if cidr:
+                permission['IpRanges'] = [{'CidrIp': cidr}]
+            source_group = kwargs.pop('source_group', None)
+            if source_group:
+                permission['UserIdGroupPairs'] = [{'GroupName': source_group}]
+            params['IpPermissions'] = [permission]
+    elif cmd == 'ec2' and subcmd == 'modify-instance-attribute':
+        if 'group' in kwargs:
+            groups = kwargs.pop('group')
+            params['Groups'] = groups.split() if isinstance(groups, basestring) else list(groups)
+
+    return params
+
+
+backends = {
+    CliBackend.name: CliBackend,
+    Boto3Backend.name: Boto3Backend,
+}
+
+__backend = None
+
+
+def set_backend(backend=None):
+    '''
+set_backend selects how __aws executes aws commands.  The function takes one
+parameter,
+
+* backend is either a name registered in backends (cli or boto3), or any
+  callable that accepts (cmd, subcmd, verbose, **kwargs) and returns a json
+  object.  If it is None, the backend is chosen by the DREAMBOX_AWS_BACKEND
+  environment variable, and falls back to cli.
+
+the function returns the backend object in use.
+    '''
+    global __backend
+    if backend is None:
+        backend = os.environ.get('DREAMBOX_AWS_BACKEND', CliBackend.name)
+    if isinstance(backend, basestring):
+        if backend not in backends:
+            raise Exception('aws backend %s is not supported' % backend)
+        backend = backends[backend]()
+    __backend = backend
+    return __backend
+
+
+def get_backend():
+    '''
+get_backend returns the backend object __aws currently uses
+    '''
+    if __backend is None:
+        set_backend()
+    return __backend
+
+
+__cache = None
+
+__limiter = RateLimiter()
+
+
+def configure_throttling(rate=None,
+                         burst=None,
+                         max_retries=5,
+                         base_delay=0.5,
+                         max_delay=20,
+                         verbose=False):
+    '''
+configure_throttling sets how __aws paces calls and handles throttling
+errors (Throttling, RequestLimitExceeded, ...).  The function takes these
+parameters,
+
+* rate is how many calls per second are allowed for each (cmd, region).
+  If it is None (the default), calls are not paced
+* burst is how many calls can be made at once before rate applies
+* max_retries is how many times a throttled call is retried; 0 disables
+  retries
+* base_delay is the backoff before the first retry in seconds.  It doubles
+  on every retry, and a random part of it is used (full jitter)
+* max_delay caps the backoff in seconds
+* verbose prints every retry to stderr
+
+the function returns the RateLimiter object in use.
+    '''
+    global __limiter
+    __limiter = RateLimiter(rate=rate,
+                            burst=burst,
+                            max_retries=max_retries,
+                            base_delay=base_delay,
+                            max_delay=max_delay,
+                            verbose=verbose)
+    return __limiter
+
+
+def get_rate_limiter():
+    '''
+get_rate_limiter returns the RateLimiter object in use
+    '''
+    return __limiter
+
+
+def enable_cache(ttl=300, maxsize=1024, path=None):
+    '''
+enable_cache turns on caching of read-only (describe-*, list-*, get-*) aws
+calls made through __aws.  The function takes these parameters,
+
+* ttl is how many seconds a result stays valid
+* maxsize is how many results are kept in memory (least recently used are
+  evicted first)
+* path is an optional directory to share results across back-to-back runs,
+  i.e. ~/.dreambox/aws-cache
+
+a mutating call (revoke-*, delete-*, suspend-*, put-*, ...) drops the cached
+results of the same command, profile and region.  The function returns the
+ResponseCache object in use.
+    '''
+    global __cache
+    __cache = ResponseCache(ttl=ttl, maxsize=maxsize, path=path)
+    return __cache
+
+
+def disable_cache():
+    '''
+disable_cache turns off caching enabled by enable_cache
+    '''
+    global __cache
+    __cache = None
+
+
+def get_cache():
+    '''
+get_cache returns the ResponseCache object in use, or None if caching is off
+    '''
+    return __cache
+
+
 def __aws(cmd=None, subcmd=None, **kwargs):
     '''
 __aws is a base function to support all awscli commands, and
@@ -24,17 +490,12 @@ Most of the awscli will return a json text back when execute
 successfully.  This function will check if any json text exists
 in standard output, and return them as python object if text is
 available.
-    '''
-    aws_func = None
-    output = None
-
-    # check if a given cmd is support by aws; raise an excpetion
-    # if not
-    if hasattr(aws, cmd):
-        aws_func = getattr(aws, cmd)
-    else:
-      raise Exception('cmd %s is not support by awscli' % cmd)
 
+The command is executed by the backend returned by get_backend(),
+which is awscli by default.  Use set_backend('boto3') to run commands
+in process through boto3 instead.  awscli failures are ignored and None
+is returned, unless strict=True is passed; then they are raised.
+    '''
     # if verbose is set, print out what is command line constructed.
     # verbose is not a valid awscli command options, so we have to
     # delete it before we pass into awscli ccommand
@@ -49,28 +510,107 @@ available.
     if 'dry_run' in kwargs and not kwargs['dry_run']:
         del kwargs['dry_run']
 
-    func = aws_func.bake(subcmd, **kwargs)
-    full_function_args =  func._path + ' ' + ' '.join(func._partial_baked_args)
-    if verbose:
-       dreambox.utils.print_structure(kwargs)
-       print('executing %s' % full_function_args)
+    # strict is not an awscli option either.  It makes the backend raise
+    # when a command fails, instead of returning None
+    backend_options = {}
+    if kwargs.pop('strict', False):
+        backend_options['strict'] = True
+
+    backend = get_backend()
+    limiter = __limiter
+    def call():
+        options = dict(kwargs, **backend_options)
+        return limiter.call((cmd, kwargs.get('region') or None),
+                            backend,
+                            cmd,
+                            subcmd,
+                            verbose=verbose,
+                            **options)
+
+    cache = __cache
+    if cache is None or kwargs.get('dry_run'):
+        return call()
+
+    if is_mutating(subcmd):
+        try:
+            return call()
+        finally:
+            cache.invalidate(cmd, kwargs.get('profile'), kwargs.get('region'))
+
+    if not is_read_only(subcmd):
+        return call()
+
+    key = ResponseCache.key(cmd, subcmd, **kwargs)
+    found, json_obj = cache.get(key)
+    if found:
+        if verbose:
+            print('cached %s %s' % (cmd, subcmd))
+        return json_obj
+
+    json_obj = call()
+    cache.put(key, json_obj)
+    return json_obj
 
-    # execute awscli command, and check if there's any output available
-    # some awscli command will not accept --dry-run flag, so we raise our
-    # custom exception to allow caller to capture and handle it.
-    try:
-        output = func()
-    except sh.ErrorReturnCode_255 as err:
-        if '--dry-run' in err.stderr:
-            raise DryRunError(full_function_args)
-    except sh.ErrorReturnCode:
-        raise sh.ErrorReturnCode
 
-    json_obj = None
-    if output and output.stdout:
-       json_obj = json.loads(output.stdout)
+def iter_pages(cmd=None, subcmd=None, page_size=1000, **kwargs):
+    '''
+iter_pages is a generator that yields the result of a list or describe
+command one page at a time, instead of loading the whole result at once.
+The function takes these parameters,
 
-    return json_obj
+* cmd is any valid awscli command
+* subcmd is any valid awscli command sub-command
+* page_size is how many items a page holds.  Use None for commands that do
+  not take a page size, i.e. describe-stack-events; their pages are as large
+  as AWS makes them
+* **kwargs is a valid parameters belongs to any give sub-command.  A query
+  is applied to each page here, after the page is fetched; passed on to
+  awscli it would drop NextToken, and paging would stop after one page
+
+a backend without paging support yields the whole result as one page.
+    '''
+    import jmespath
+    verbose = kwargs.pop('verbose', False)
+    query   = kwargs.pop('query', None)
+    if 'dry_run' in kwargs and not kwargs['dry_run']:
+        del kwargs['dry_run']
+
+    backend = get_backend()
+    if hasattr(backend, 'iter_pages'):
+        pages = backend.iter_pages(cmd, subcmd, page_size=page_size, verbose=verbose, **kwargs)
+    else:
+        pages = [backend(cmd, subcmd, verbose=verbose, **kwargs)]
+    for page in pages:
+        if page is not None:
+            yield jmespath.search(query, page) if query else page
+
+
+def iter_items(cmd=None, subcmd=None, result_key=None, query=None, page_size=1000, **kwargs):
+    '''
+iter_items is a generator that yields items of a list or describe command
+lazily, page by page.  The function takes these parameters,
+
+* cmd is any valid awscli command
+* subcmd is any valid awscli command sub-command
+* result_key is the key of the list to yield from each page, i.e. DBSnapshots
+* query is a jmespath query applied to each page; it has to return a list,
+  i.e. Reservations[].Instances[].InstanceId.  It is used instead of
+  result_key when it is given
+* page_size is how many items a page holds
+* **kwargs is a valid parameters belongs to any give sub-command
+
+items can be filtered as they arrive, so memory does not grow with the size
+of the account.
+    '''
+    for page in iter_pages(cmd, subcmd, page_size=page_size, query=query, **kwargs):
+        if query:
+            items = page
+        elif result_key:
+            items = page.get(result_key)
+        else:
+            items = page
+        for item in items or []:
+            yield item
 
 
 def ec2(*args, **kwargs):
@@ -149,25 +689,120 @@ def s3api(*args, **kwargs):
 
     return s3api_json_obj
 
+class JsonObject(object):
+    '''
+JsonObject is an attribute access view over a parsed json hash, so
+obj.a.b.c reads obj['a']['b']['c'].  Nested hashes and lists are wrapped
+only when they are accessed, and nothing is copied.  Items can also be read
+with obj['key'], and iterating an object yields its keys.
+    '''
+    __slots__ = ('_data',)
+
+    def __init__(self, data=None):
+        self._data = data if data is not None else {}
+
+    def __getattr__(self, name):
+        if name == '_data':
+            raise AttributeError(name)
+        try:
+            return _wrap_json(self._data[name])
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, key):
+        return _wrap_json(self._data[key])
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __dir__(self):
+        return list(self._data)
+
+    def __eq__(self, other):
+        if isinstance(other, JsonObject):
+            other = other._data
+        return self._data == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'JsonObject(%r)' % (self._data,)
+
+    def __reduce__(self):
+        # rebuild through the constructor; a falsy __getstate__ result ({} or
+        # []) would make pickle skip __setstate__ and leave _data unset
+        return (self.__class__, (self._data,))
+
+
+class JsonList(object):
+    '''
+JsonList is a read-only view over a parsed json list whose hashes and lists
+are wrapped the same way JsonObject wraps them, when they are accessed.
+    '''
+    __slots__ = ('_data',)
+
+    def __init__(self, data=None):
+        self._data = data if data is not None else []
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return JsonList(self._data[index])
+        return _wrap_json(self._data[index])
+
+    def __iter__(self):
+        return (_wrap_json(item) for item in self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, item):
+        return item in self._data
+
+    def __eq__(self, other):
+        if isinstance(other, JsonList):
+            other = other._data
+        return self._data == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'JsonList(%r)' % (self._data,)
+
+    def __reduce__(self):
+        # rebuild through the constructor; a falsy __getstate__ result ({} or
+        # []) would make pickle skip __setstate__ and leave _data unset
+        return (self.__class__, (self._data,))
+
+
+def _wrap_json(value):
+    if isinstance(value, dict):
+        return JsonObject(value)
+    if isinstance(value, list):
+        return JsonList(value)
+    return value
+
+
 def json_to_pyobj(json_obj):
     '''
 json_to_pyobj is a function that converts json object to
 a python object.  This function takes one parameters,
 
-* json_obj is a valid python hash that represents json
+* json_obj is a valid python hash (or list) that represents json
 
 when the function executes successfully, a live python object
-returns.
+returns.  The object is a JsonObject (or JsonList) view; nested values
+are converted lazily when they are accessed, and the object can be
+pickled.
     '''
-    def hash2obj(hash):
-        if isinstance(hash, dict):
-            return type('jo', (), {
-                k: hash2obj(v) for k, v in hash.iteritems()
-                })
-        else:
-            return hash
-
-    return hash2obj(json_obj)
+    return _wrap_json(json_obj)
 
 
 def s3(cmd, *args, **kwargs):
@@ -1,11 +1,13 @@
 from __future__ import print_function
 import dreambox.aws.core as aws
+from dreambox.aws.filters import ServerFilter
+from dreambox.aws.regions import for_each_region
 import dreambox.utils
 import types
 import sh
 
   
-def get_ec2_hosts_for_stage(profile='', regions=None, stage=None):
+def get_ec2_hosts_for_stage(profile='', regions=None, stage=None, states=None):
     '''
 get_ec2_hosts_for_stage  will return ec2 instance information for a given
 stage environment.  This function takes the following parameters,
@@ -17,6 +19,12 @@ stage environment.  This function takes the following parameters,
 * regions - a list of regions to search for a target environment. If this is
             None, it will search for us-east-1 and us-west-2.
 * stage - a stage environment to look for
+* states - an optional list of instance states to return, i.e. ['running']
+
+states are sent to AWS as a describe-instances filter, so only the matching
+instances come back.  stage is sent as a Name tag filter that matches it in
+any case; since that filter may let a few other instances through, stage is
+matched case insensitively here as well.
     '''
 
     def make_hash_from_ec2tag(a_list, stage):
@@ -35,17 +43,25 @@ stage environment.  This function takes the following parameters,
 
 
     inst_qry = 'Reservations[].Instances[].[PublicDnsName,PublicIpAddress,Tags[?Key==`Name`].Value]'
-    instances = {}
     if regions is None:
         regions = ['us-east-1', 'us-west-2']
 
-    for region in regions:
+    server_filter = ServerFilter('ec2', 'describe-instances')
+    if stage is not None:
+        server_filter.contains('tag:Name', stage)
+    if states:
+        server_filter.add('instance-state-name', states)
+
+    def get_region_instances(region):
         region_instances = aws.ec2('describe-instances',
                                    profile=profile,
                                    region=region,
-                                   query=inst_qry)
+                                   query=inst_qry,
+                                   **server_filter.options())
         # dreambox.utils.print_structure(region_instances)
-        instances[region] = make_hash_from_ec2tag(region_instances, stage)
+        return make_hash_from_ec2tag(region_instances, stage)
+
+    instances = for_each_region(get_region_instances, regions)
 
     return instances
 
@@ -58,15 +74,21 @@ The function takes the following parameters,
 * region is an AWS region
 * filterby is a function that filter through a list of instances
 * **options is any valid aws describe-instances command line options
+
+instances are fetched a page at a time, and filterby is applied as they
+arrive.  query is applied to each page, so it has to return a list, i.e.
+Reservations[].Instances[].InstanceId
     '''
-    instances = aws.ec2('describe-instances',
-                        profile=profile,
-                        region=region,
-                        **kwargs)
+    instances = aws.iter_items('ec2',
+                               'describe-instances',
+                               result_key='Reservations',
+                               profile=profile,
+                               region=region,
+                               **kwargs)
     if filterby is not None and type(filterby) is types.FunctionType:
         instances = filter(filterby, instances)
 
-    return instances
+    return list(instances)
 
 
 def list_instances_securitygroups(profile=None,
@@ -0,0 +1,117 @@
+from __future__ import print_function
+import json
+
+# filters each command accepts in --filters, and whether the filter values
+# may contain * and ? wildcards.  A filter that is not listed here can not be
+# pushed to AWS, and has to be applied by the caller.
+SUPPORTED_FILTERS = {
+    ('ec2', 'describe-instances'): {
+        'tag:Name': True,
+        'tag-key': True,
+        'instance-state-name': True,
+        'instance-id': True,
+        'instance.group-id': True,
+        'instance.group-name': True,
+    },
+    ('ec2', 'describe-security-groups'): {
+        'group-name': True,
+        'group-id': True,
+        'tag:Name': True,
+        'vpc-id': True,
+    },
+    ('rds', 'describe-db-snapshots'): {
+        'db-instance-id': False,
+        'db-snapshot-id': False,
+        'snapshot-type': False,
+        'engine': False,
+    },
+}
+
+# how many values a case insensitive filter is spelled out into.  Letters
+# past the ones that fit are sent as a ? wildcard
+MAX_CASE_VARIANTS = 64
+
+
+def case_insensitive_values(value=None, limit=MAX_CASE_VARIANTS):
+    '''
+    return wildcard values that match value in any case.  AWS matches filter
+    values case sensitively, so every lower/upper case spelling of the first
+    letters is listed, as long as there are no more than limit of them, and
+    the remaining letters become ?.  The values may match more than value
+    does, never less, so the caller still has to filter on its side.  * ? and
+    \\ in value are escaped.
+    '''
+    values = ['']
+    for c in value:
+        if c in '*?\\':
+            values = [v + '\\' + c for v in values]
+        elif c.lower() == c.upper():
+            values = [v + c for v in values]
+        elif len(values) * 2 <= limit:
+            values = [v + x for v in values for x in (c.lower(), c.upper())]
+        else:
+            values = [v + '?' for v in values]
+    return values
+
+
+class ServerFilter(object):
+    '''
+ServerFilter collects filters for an aws list or describe command, and turns
+the ones the command supports into its --filters option.  The constructor
+takes these parameters,
+
+* cmd is an awscli command, i.e. ec2
+* subcmd is an awscli sub-command, i.e. describe-instances
+
+add() returns whether a filter could be pushed to AWS.  When it returns
+False, the caller keeps filtering on its side as before.
+    '''
+
+    def __init__(self, cmd=None, subcmd=None):
+        self._supported = SUPPORTED_FILTERS.get((cmd, subcmd), {})
+        self._filters = []
+
+    def add(self, name=None, values=None, wildcard=False):
+        '''
+        add a filter.  The method takes these parameters,
+
+        * name is a filter name, i.e. tag:Name or instance-state-name
+        * values is a value or a list of values, any of them matches
+        * wildcard tells if values contain * or ? wildcards
+        '''
+        if name not in self._supported:
+            return False
+        if wildcard and not self._supported[name]:
+            return False
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        self._filters.append({'Name': name, 'Values': list(values)})
+        return True
+
+    def contains(self, name=None, value=None):
+        '''
+        add a case insensitive substring filter, i.e. a Name tag containing
+        stage3.  Only commands that support wildcards can take it, and since
+        it may match more than asked for (see case_insensitive_values), the
+        caller keeps filtering on its side.
+        '''
+        return self.add(name,
+                        ['*%s*' % v for v in case_insensitive_values(value)],
+                        wildcard=True)
+
+    def startswith(self, name=None, value=None):
+        '''
+        add a case insensitive prefix filter.  Like contains, the caller keeps
+        filtering on its side.
+        '''
+        return self.add(name,
+                        ['%s*' % v for v in case_insensitive_values(value)],
+                        wildcard=True)
+
+    def options(self):
+        '''
+        return the options to pass to the aws command, i.e. { 'filters': ... }
+        '''
+        if not self._filters:
+            return {}
+        return {'filters': json.dumps(self._filters)}
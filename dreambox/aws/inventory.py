@@ -0,0 +1,220 @@
+from __future__ import print_function
+from datetime import datetime
+from datetime import timedelta
+from funcy.seqs import chunks
+import dreambox.aws.core as aws
+import sys
+import threading
+
+# describe-auto-scaling-groups accepts up to 50 group names per call, and
+# describe-scaling-activities returns up to 100 activities per page
+MAX_NAMES_PER_CALL = 50
+ACTIVITIES_PAGE_SIZE = 100
+
+# scaling activities that started this many seconds before the last refresh
+# are looked at again, in case the clocks of AWS and this host disagree
+CLOCK_SKEW = 60
+
+# activities in these states will not change a group any more
+FINISHED_ACTIVITIES = ('Successful', 'Failed', 'Cancelled')
+
+
+def parse_timestamp(value=None):
+    '''
+    turn an AWS timestamp into a naive UTC datetime.  awscli prints
+    2016-01-01T00:00:00.123Z, and the boto3 backend prints
+    2016-01-01T00:00:00.123000+00:00; both are UTC.
+    '''
+    return datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+class AsgInventory(object):
+    '''
+AsgInventory keeps the autoscaling groups of a region in memory, and brings
+them up to date incrementally.  The constructor takes these parameters,
+
+* profile is a profile defined in ~/.aws/config
+* region is a valid region defined by AWS
+* max_age is how many seconds a full snapshot is trusted.  Groups that are
+  created or deleted without any scaling activity are only noticed by a full
+  snapshot, so refresh() takes a new one once the last is older than max_age.
+  None means never
+* verbose prints what each refresh did to stderr
+
+refresh() probes describe-scaling-activities for activities since the last
+refresh, and re-describes only the groups that had one.  instance_ids() and
+the hashes returned by index() and by_name_tag() are plain dict lookups.
+    '''
+
+    def __init__(self, profile='', region='us-east-1', max_age=3600, verbose=False):
+        self.profile      = profile
+        self.region       = region
+        self.max_age      = max_age
+        self.verbose      = verbose
+        self.refreshed    = None
+        self.snapshotted  = None
+        self._index       = {}
+        self._name_tags   = {}
+        self._by_name_tag = {}
+        self._in_progress = set()
+        self._lock        = threading.Lock()
+
+    def _describe(self, asg_names=None):
+        '''
+        describe every group of the region, or only the groups of asg_names
+        (MAX_NAMES_PER_CALL names per call), and return
+        { asg name: { 'instance_ids': [...], 'name_tag': ... } }
+        '''
+        qry = 'AutoScalingGroups[].[AutoScalingGroupName,Instances[].InstanceId,Tags[?Key==`Name`].Value|[0]]'
+        batches = [None] if asg_names is None else chunks(MAX_NAMES_PER_CALL, sorted(asg_names))
+        groups = {}
+        for names in batches:
+            options = {} if names is None else {'auto_scaling_group_names': names}
+            result = aws.autoscaling('describe-auto-scaling-groups',
+                                     profile=self.profile,
+                                     region=self.region,
+                                     query=qry,
+                                     **options)
+            for asg_name, instance_ids, name_tag in result or []:
+                groups[asg_name] = {'instance_ids': instance_ids or [], 'name_tag': name_tag}
+        return groups
+
+    def _changed_groups(self, since=None):
+        '''
+        return the names of the groups with a scaling activity that started
+        after since, and the names of the groups whose activity is still
+        running.  Activities come newest first, so paging stops at the first
+        activity older than since.
+        '''
+        changed = set()
+        running = set()
+        for page in aws.iter_pages('autoscaling',
+                                   'describe-scaling-activities',
+                                   page_size=ACTIVITIES_PAGE_SIZE,
+                                   profile=self.profile,
+                                   region=self.region):
+            done = False
+            for activity in page.get('Activities', []):
+                if parse_timestamp(activity['StartTime']) < since:
+                    done = True
+                    break
+                changed.add(activity['AutoScalingGroupName'])
+                if activity.get('StatusCode') not in FINISHED_ACTIVITIES:
+                    running.add(activity['AutoScalingGroupName'])
+            if done:
+                break
+        return changed, running
+
+    def snapshot(self):
+        '''
+        describe every group of the region, and replace what is in memory
+        '''
+        # a cached describe or probe would hide changes
+        cache = aws.get_cache()
+        if cache is not None:
+            cache.invalidate('autoscaling', self.profile, self.region)
+
+        started = datetime.utcnow()
+        groups = self._describe()
+        with self._lock:
+            self._index.clear()
+            self._name_tags.clear()
+            self._by_name_tag.clear()
+            for asg_name, group in groups.items():
+                self._set_group(asg_name, group)
+            self._in_progress = set()
+            self.refreshed = self.snapshotted = started
+        if self.verbose:
+            print('asg inventory %s: snapshot of %d groups' % (self.region, len(groups)), file=sys.stderr)
+        return self
+
+    def refresh(self):
+        '''
+        bring the inventory up to date.  The first call, and a call after
+        max_age seconds, takes a full snapshot.  Any other call re-describes
+        only the groups with scaling activities since the last refresh, plus
+        the groups whose activities were still running then.
+        '''
+        now = datetime.utcnow()
+        if self.snapshotted is None or \
+           (self.max_age is not None and now - self.snapshotted > timedelta(seconds=self.max_age)):
+            return self.snapshot()
+
+        cache = aws.get_cache()
+        if cache is not None:
+            cache.invalidate('autoscaling', self.profile, self.region)
+
+        changed, running = self._changed_groups(self.refreshed - timedelta(seconds=CLOCK_SKEW))
+        changed |= self._in_progress
+        groups = self._describe(changed) if changed else {}
+        with self._lock:
+            for asg_name in changed:
+                # a group that can not be described any more was deleted
+                self._set_group(asg_name, groups.get(asg_name))
+            self._in_progress = running
+            self.refreshed = now
+        if self.verbose:
+            print('asg inventory %s: %d of %d groups changed' % (self.region, len(changed), len(self._index)),
+                  file=sys.stderr)
+        return self
+
+    def _set_group(self, asg_name=None, group=None):
+        '''
+        update the indexes for one group; a group of None removes it
+        '''
+        name_tag = self._name_tags.pop(asg_name, None)
+        if name_tag is not None and self._by_name_tag.get(name_tag) is self._index.get(asg_name):
+            del self._by_name_tag[name_tag]
+        self._index.pop(asg_name, None)
+        if group is None:
+            return
+
+        self._index[asg_name] = group['instance_ids']
+        if group['name_tag']:
+            self._name_tags[asg_name] = group['name_tag']
+            self._by_name_tag[group['name_tag']] = group['instance_ids']
+
+    def instance_ids(self, asg_name=None):
+        '''
+        return the instance ids of an autoscaling group, or None if there is
+        no such group
+        '''
+        return self._index.get(asg_name)
+
+    def index(self):
+        '''
+        return the { asg name: [ instance id, ... ] } hash the inventory keeps
+        up to date.  It is not a copy, so do not change it.
+        '''
+        return self._index
+
+    def by_name_tag(self):
+        '''
+        return a { Name tag: [ instance id, ... ] } hash for the groups that
+        have a Name tag.  It is not a copy, so do not change it.
+        '''
+        return self._by_name_tag
+
+    def __contains__(self, asg_name):
+        return asg_name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+
+# inventories shared by get_asg_inventory, one per (profile, region)
+__inventories = {}
+__inventories_lock = threading.Lock()
+
+
+def get_asg_inventory(profile='', region='us-east-1', max_age=3600):
+    '''
+get_asg_inventory returns the AsgInventory of a profile and region, creating
+it the first time.  The same object is returned to every caller in the
+process, so each refresh() only looks at what changed since the last one.
+    '''
+    key = (profile or '', region)
+    with __inventories_lock:
+        if key not in __inventories:
+            __inventories[key] = AsgInventory(profile=profile, region=region, max_age=max_age)
+        return __inventories[key]
@@ -1,8 +1,9 @@
 from __future__ import print_function
 import dreambox.aws.core as aws
+from dreambox.aws.filters import ServerFilter
 import dreambox.utils
 
-def describe_rds_snapshots(profile='', region='us-east-1', env_prefix=''):
+def describe_rds_snapshots(profile='', region='us-east-1', env_prefix='', snapshot_type=None):
     '''
 get_rds_snapshots will return a list of RDS database snapshots to a
 caller. The function takes the following parameters:
@@ -14,14 +15,26 @@ caller. The function takes the following parameters:
 * regions - a list of regions to search for a target environment. If this is
             None, it will search for us-east-1 and us-west-2.
 * env_prefix - an environment prefix like stage1, ..., stage9
+* snapshot_type - an optional snapshot type (automated, manual, ...).  It is
+                  sent to AWS as a filter.  env_prefix is a substring match
+                  AWS can not express, so it is applied as snapshots arrive
     '''
-    db_snapshots = []
+    # snapshots are fetched a page at a time and filtered as they arrive, so
+    # only the matching ones are kept in memory
+    server_filter = ServerFilter('rds', 'describe-db-snapshots')
+    if snapshot_type is not None:
+        server_filter.add('snapshot-type', snapshot_type)
+    db_snapshots = aws.iter_items('rds',
+                                  'describe-db-snapshots',
+                                  result_key='DBSnapshots',
+                                  profile=profile,
+                                  region=region,
+                                  **server_filter.options())
     if env_prefix != '':
-        for db_snapshot in aws.rds('describe-db-snapshots', profile=profile, region=region)['DBSnapshots']:
-            if env_prefix.lower() in db_snapshot['DBSnapshotIdentifier']:
-                db_snapshots.append(db_snapshot)
+        db_snapshots = [s for s in db_snapshots
+                        if env_prefix.lower() in s['DBSnapshotIdentifier']]
     else:
-        db_snapshots = [s for s in aws.rds('describe-db-snapshots', profile=profile, region=region)['DBSnapshots']]
+        db_snapshots = list(db_snapshots)
 
     return db_snapshots
 
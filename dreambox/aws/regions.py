@@ -0,0 +1,161 @@
+from __future__ import print_function
+from multiprocessing.pool import ThreadPool
+import multiprocessing
+import sys
+import time
+
+# the number of keys (regions, stacks, groups, ...) worked on at the same
+# time, and how many seconds a key is allowed to take.  None means no timeout
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = None
+
+# used in place of "no timeout" while waiting for a key
+__FOREVER = 365 * 24 * 60 * 60
+
+# how many seconds to wait at a time for a queued key to be picked up
+__QUEUED_POLL = 0.05
+
+
+class FanOutTimeoutError(Exception):
+    def __init__(self, key, timeout, kind='key'):
+        super(FanOutTimeoutError, self).__init__('%s %s did not finish in %s seconds' % (kind, key, timeout))
+        self.key = key
+        self.timeout = timeout
+
+
+class RegionTimeoutError(FanOutTimeoutError):
+    def __init__(self, region, timeout):
+        super(RegionTimeoutError, self).__init__(region, timeout, 'region')
+        self.region = region
+
+
+def for_each_region(func,
+                    regions=None,
+                    max_workers=None,
+                    timeout=None,
+                    errors=None,
+                    timings=None,
+                    verbose=False):
+    '''
+for_each_region calls func once per region concurrently, and collects the
+results into a {region: result} hash.  It is for_each with region defaults,
+
+* regions is a list of AWS regions.  If it is None, us-east-1 and us-west-2
+  are used.  Any hashable value works as a key, so a list of (service, region)
+  pairs can be fanned out as well; for keys that are not regions, such as
+  stack or group names, use for_each, which has no region defaults
+* timeouts raise RegionTimeoutError
+
+the other parameters are the same as for_each's.
+    '''
+    if regions is None:
+        regions = ['us-east-1', 'us-west-2']
+    return __fan_out(func, regions, max_workers, timeout, errors, timings, verbose,
+                     'region', RegionTimeoutError)
+
+
+def for_each(func,
+             keys=None,
+             max_workers=None,
+             timeout=None,
+             errors=None,
+             timings=None,
+             verbose=False):
+    '''
+for_each calls func once per key concurrently, and collects the results into
+a {key: result} hash.  The function takes these parameters,
+
+* func is a function that takes a key as its only parameter
+* keys is a list of hashable values, i.e. stack names.  No key means no call
+* max_workers is the largest number of keys worked on at the same time.
+  If it is None, DEFAULT_MAX_WORKERS is used
+* timeout is how many seconds a key is allowed to take, counted from the
+  time a worker picks it up, so time spent queued behind max_workers other
+  keys does not count.  It applies to a single key or a single worker as
+  well.  If it is None, DEFAULT_TIMEOUT is used
+* errors is an optional hash.  When it is given, an exception raised for a
+  key (or a FanOutTimeoutError) is stored in it, and that key is left out of
+  the result.  When it is None, the first failure is re-raised after all keys
+  are done, the same way a serial loop would fail
+* timings is an optional hash.  When it is given, the number of seconds each
+  key took is stored in it
+* verbose prints how long each key took to stderr
+
+the function returns {key: result} for every key that succeeded.
+    '''
+    return __fan_out(func, keys or [], max_workers, timeout, errors, timings, verbose,
+                     'key', FanOutTimeoutError)
+
+
+def __fan_out(func, keys, max_workers, timeout, errors, timings, verbose, kind, timeout_error):
+    # kind names the keys in timeout errors and verbose output
+    if max_workers is None:
+        max_workers = DEFAULT_MAX_WORKERS
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+
+    keys = list(keys)
+    results = {}
+    failures = {}
+    elapsed = {}
+    started = {}
+
+    def timed(key):
+        start = started[key] = time.time()
+        try:
+            return func(key)
+        finally:
+            elapsed[key] = time.time() - start
+
+    # nothing to gain from a pool for a single key or a single worker,
+    # unless there is a timeout, which only a worker thread can enforce
+    if (len(keys) <= 1 or max_workers <= 1) and timeout is None:
+        for key in keys:
+            try:
+                results[key] = timed(key)
+            except Exception as err:
+                failures[key] = err
+    else:
+        pool = ThreadPool(max(min(max_workers, len(keys)), 1))
+        try:
+            pending = [(key, pool.apply_async(timed, (key,))) for key in keys]
+            for key, async_result in pending:
+                try:
+                    if timeout is None:
+                        # a finite timeout keeps the wait interruptible by
+                        # ctrl-c in python 2
+                        results[key] = async_result.get(__FOREVER)
+                        continue
+                    # the deadline of a key starts once a worker runs it
+                    while key not in started and not async_result.ready():
+                        async_result.wait(__QUEUED_POLL)
+                    if key not in started:
+                        results[key] = async_result.get(0)
+                    else:
+                        deadline = started[key] + timeout
+                        results[key] = async_result.get(max(deadline - time.time(), 0))
+                except multiprocessing.TimeoutError:
+                    failures[key] = timeout_error(key, timeout)
+                except Exception as err:
+                    failures[key] = err
+        finally:
+            # a key that timed out is still running; do not wait for it
+            if failures:
+                pool.terminate()
+            else:
+                pool.close()
+
+    if timings is not None:
+        timings.update(elapsed)
+
+    if verbose:
+        for key in keys:
+            status = 'failed' if key in failures else 'ok'
+            print('%s %s %s in %.3fs' % (kind, key, status, elapsed.get(key, 0)), file=sys.stderr)
+
+    if failures:
+        if errors is None:
+            raise failures[[key for key in keys if key in failures][0]]
+        errors.update(failures)
+
+    return results
@@ -1,6 +1,10 @@
 from __future__ import print_function
 import dreambox.aws.core as aws
+from dreambox.aws.filters import ServerFilter
+from dreambox.aws.regions import for_each, for_each_region
 import dreambox.utils
+import json
+import re
 import sys
 
 
@@ -14,14 +18,18 @@ def get_all_ec2_security_groups(profile='',
     if regions is None:
         regions = ['us-east-1', 'us-west-2']
 
-    ec2_results = []
-    ec2_result = {}
-    for region in regions:
-        ec2_result[region] = aws.ec2('describe-security-groups',
-                                     profile=profile,
-                                     region=region,
-                                     query=query)
-        ec2_results.extend(ec2_result)
+    # fetch only groups whose name starts with filterby in any case; the
+    # server filter may let a few others through, so filter_list_by below
+    # still does the exact case insensitive match
+    server_filter = ServerFilter('ec2', 'describe-security-groups')
+    if filterby is not None:
+        server_filter.startswith('group-name', filterby)
+    ec2_result = for_each_region(lambda region: aws.ec2('describe-security-groups',
+                                                        profile=profile,
+                                                        region=region,
+                                                        query=query,
+                                                        **server_filter.options()),
+                                 regions)
 
     return dreambox.utils.filter_list_by(ec2_result, myfilter=filterby)
 
@@ -36,14 +44,11 @@ def get_all_elasticcache_security_groups(profile='',
 
     if query is None:
         query = 'CacheSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'
-    ecache_results = []
-    ecache_result = {}
-    for region in regions:
-        ecache_result[region] = aws.elasticache('describe-cache-security-groups',
-                                                profile=profile,
-                                                region=region,
-                                                query=query)
-        ecache_results.extend(ecache_result)
+    ecache_result = for_each_region(lambda region: aws.elasticache('describe-cache-security-groups',
+                                                                   profile=profile,
+                                                                   region=region,
+                                                                   query=query),
+                                    regions)
 
     return dreambox.utils.filter_list_by(ecache_result, myfilter=filterby)
 
@@ -60,15 +65,12 @@ def get_all_rds_security_groups(profile='',
     if query is None:
         query = 'DBSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'
 
-    rds_results = []
-    rds_result = {}
-    for region in regions:
-        rds_result[region] = aws.rds('describe-db-security-groups',
-                                     profile=profile,
-                                     region=region,
-                                     verbose=verbose,
-                                     query=query)
-        rds_results.extend(rds_result)
+    rds_result = for_each_region(lambda region: aws.rds('describe-db-security-groups',
+                                                        profile=profile,
+                                                        region=region,
+                                                        verbose=verbose,
+                                                        query=query),
+                                 regions)
 
     return dreambox.utils.filter_list_by(rds_result, myfilter=filterby)
 
@@ -228,34 +230,106 @@ def get_all_redshift_security_groups(ec2profile='',
                                      regions=['us-east-1', 'us-west-2'],
                                      filterby=None):
 
-    redshift_results = []
-    redshift_result = {}
-    for region in regions:
-        redshift_result[region] = aws.redshift('describe-cluster-security-groups',
-                                               profile=ec2profile,
-                                               region=region,
-                                               query='ClusterSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName')
-        redshift_results.extend(redshift_result)
+    redshift_result = for_each_region(lambda region: aws.redshift('describe-cluster-security-groups',
+                                                                  profile=ec2profile,
+                                                                  region=region,
+                                                                  query='ClusterSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'),
+                                      regions)
 
     return dreambox.utils.filter_list_by(redshift_result, myfilter=filterby)
 
 
+# the describe call and query get_all_security_groups issues for each service
+__security_group_queries = {
+    'ec2': ('ec2',
+            'describe-security-groups',
+            'SecurityGroups[].GroupName'),
+    'elasticcache': ('elasticache',
+                     'describe-cache-security-groups',
+                     'CacheSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'),
+    'rds': ('rds',
+            'describe-db-security-groups',
+            'DBSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'),
+    'redshift': ('redshift',
+                 'describe-cluster-security-groups',
+                 'ClusterSecurityGroups[].EC2SecurityGroups[].EC2SecurityGroupName'),
+}
+
+
 def get_all_security_groups(my_ec2profile='',
                             my_regions=['us-east-1', 'us-west-2'],
-                            my_filterby=None):
+                            my_filterby=None,
+                            parallel=False,
+                            timings=None,
+                            verbose=False):
+    '''
+get_all_security_groups will return ec2, elasticache, rds and redshift
+security groups for the given regions as a hash like this,
+
+    { 'ec2': { region: [group, ...] }, 'rds': ..., 'elasticcache': ..., 'redshift': ... }
+
+The function takes these parameters,
+
+* my_ec2profile is an aws profile defined in ~/.aws/config
+* my_regions is a list of AWS regions
+* my_filterby only keeps security groups whose name starts with it
+* parallel fetches every service and region pair at the same time instead of
+  one service after another
+* timings is an optional hash.  In parallel mode it is filled with how many
+  seconds each call took, as { service: { region: seconds } }
+* verbose prints the timing breakdown to stderr in parallel mode
+    '''
+    if not parallel:
+        results = {}
+        results['ec2'] = get_all_ec2_security_groups(profile=my_ec2profile,
+                                                     regions=my_regions,
+                                                     filterby=my_filterby)
+        results['elasticcache'] = get_all_elasticcache_security_groups(profile=my_ec2profile,
+                                                                       regions=my_regions,
+                                                                       filterby=my_filterby)
+        results['rds'] = get_all_rds_security_groups(profile=my_ec2profile,
+                                                     regions=my_regions,
+                                                     filterby=my_filterby)
+        results['redshift'] = get_all_redshift_security_groups(ec2profile=my_ec2profile,
+                                                               regions=my_regions,
+                                                               filterby=my_filterby)
+        return results
+
+    def get_cell(cell):
+        service, region = cell
+        cmd, subcmd, query = __security_group_queries[service]
+        server_filter = ServerFilter(cmd, subcmd)
+        if my_filterby is not None:
+            server_filter.startswith('group-name', my_filterby)
+        return getattr(aws, cmd)(subcmd,
+                                 profile=my_ec2profile,
+                                 region=region,
+                                 query=query,
+                                 **server_filter.options())
+
+    cells = [(service, region) for service in sorted(__security_group_queries)
+                               for region in my_regions]
+    cell_timings = {}
+    cell_results = for_each(get_cell,
+                            cells,
+                            max_workers=len(cells),
+                            timings=cell_timings)
+
+    matrix = dict((service, {}) for service in __security_group_queries)
+    for (service, region), result in cell_results.items():
+        matrix[service][region] = result
+
+    if timings is not None:
+        for (service, region), seconds in cell_timings.items():
+            timings.setdefault(service, {})[region] = seconds
+    if verbose:
+        for service, region in sorted(cell_timings, key=cell_timings.get, reverse=True):
+            print('%-12s %-10s %.3fs' % (service, region, cell_timings[(service, region)]),
+                  file=sys.stderr)
+
     results = {}
-    results['ec2'] = get_all_ec2_security_groups(profile=my_ec2profile,
-                                                 regions=my_regions,
-                                                 filterby=my_filterby)
-    results['elasticcache'] = get_all_elasticcache_security_groups(profile=my_ec2profile,
-                                                                   regions=my_regions,
-                                                                   filterby=my_filterby)
-    results['rds'] = get_all_rds_security_groups(profile=my_ec2profile,
-                                                 regions=my_regions,
-                                                 filterby=my_filterby)
-    results['redshift'] = get_all_redshift_security_groups(ec2profile=my_ec2profile,
-                                                           regions=my_regions,
-                                                           filterby=my_filterby)
+    for service, region_groups in matrix.items():
+        results[service] = dreambox.utils.filter_list_by(region_groups, myfilter=my_filterby)
     return results
 
 def delete_security_groups(ec2profile='',
@@ -269,7 +343,8 @@ def delete_security_groups(ec2profile='',
 
     security_groups_to_delete = get_all_security_groups(ec2profile,
                                                         regions,
-                                                        my_filterby)
+                                                        my_filterby,
+                                                        parallel=True)
     for cmdcat, regions in security_groups_to_delete.items():
         for region, security_groups in regions.items():
             for security_group in security_groups:
@@ -323,28 +398,179 @@ def revoke_all_elasticache_ingress_rules_for_stage(ec2profile=None,
                       file=sys.stderr)
 
 
+# how revoke_all_ingress_rules finds ingress rules for each service: the
+# describe call, its query, and the revoke sub-command plus the option names
+# for the security group, and the ec2 security group name and owner it grants
+__ingress_rule_sources = {
+    'rds': ('describe-db-security-groups',
+            'DBSecurityGroups[].[DBSecurityGroupName,EC2SecurityGroups[].[EC2SecurityGroupName,EC2SecurityGroupOwnerId]]',
+            'revoke-db-security-group-ingress',
+            'db_security_group_name'),
+    'redshift': ('describe-cluster-security-groups',
+                 'ClusterSecurityGroups[].[ClusterSecurityGroupName,EC2SecurityGroups[].[EC2SecurityGroupName,EC2SecurityGroupOwnerId]]',
+                 'revoke-cluster-security-group-ingress',
+                 'cluster_security_group_name'),
+    'elasticache': ('describe-cache-security-groups',
+                    'CacheSecurityGroups[].[CacheSecurityGroupName,EC2SecurityGroups[].[EC2SecurityGroupName,EC2SecurityGroupOwnerId]]',
+                    'revoke-cache-security-group-ingress',
+                    'cache_security_group_name'),
+    'ec2': ('describe-security-groups',
+            'SecurityGroups[].[GroupName,IpPermissions]',
+            'revoke-security-group-ingress',
+            'group_name'),
+}
+
+
+def __ip_permission_rule(permission):
+    '''
+    describe an ec2 ip permission the way it shows up in the result table,
+    i.e. tcp:80 10.0.0.0/8
+    '''
+    protocol = permission.get('IpProtocol')
+    if 'FromPort' in permission and permission['FromPort'] != permission.get('ToPort'):
+        port = '%s-%s' % (permission['FromPort'], permission.get('ToPort'))
+    else:
+        port = permission.get('ToPort', 'all')
+    sources = [r['CidrIp'] for r in permission.get('IpRanges') or []] + \
+              [p.get('GroupName') or p.get('GroupId') for p in permission.get('UserIdGroupPairs') or []]
+    return '%s:%s %s' % (protocol, port, ','.join(sources))
+
+
+def get_ingress_revocations(ec2profile='',
+                            regions=None,
+                            filterby=None):
+    '''
+get_ingress_revocations returns the revoke calls needed to remove all the
+ingress rules for a stage environment.  The function takes these parameters,
+
+* ec2profile is an aws profile defined in ~/.aws/config
+* regions is a list of AWS regions
+* filterby is a stage environment, i.e. stage3.  rds, redshift and
+  elasticache rules granted to an ec2 security group matching it, and every
+  rule of an ec2 security group matching it are returned
+
+the function returns a list of hashes, one per revoke call,
+
+    { 'service': 'ec2', 'region': region, 'security_group': group_name,
+      'rules': [rule, ...], 'subcmd': subcmd, 'options': { ... } }
+
+ec2 allows many permissions in one revoke-security-group-ingress call, so an
+ec2 security group is revoked with a single call carrying all its rules.
+The other services take one ec2 security group per call.
+    '''
+    if regions is None:
+        regions = ['us-east-1', 'us-west-2']
+
+    m = dreambox.utils.compile_regex(r'{0}\b'.format(filterby) if filterby else '', re.I)
+
+    def describe(cell):
+        service, region = cell
+        subcmd, query = __ingress_rule_sources[service][0:2]
+        return getattr(aws, service)(subcmd,
+                                     profile=ec2profile,
+                                     region=region,
+                                     query=query) or []
+
+    cells = [(service, region) for service in sorted(__ingress_rule_sources)
+                               for region in regions]
+    described = for_each(describe, cells, max_workers=len(cells))
+
+    revocations = []
+    for service, region in cells:
+        subcmd, group_option = __ingress_rule_sources[service][2:4]
+        for group_name, grants in described[(service, region)]:
+            if service == 'ec2':
+                if not grants or not m.match(group_name):
+                    continue
+                revocations.append({'service': service,
+                                    'region': region,
+                                    'security_group': group_name,
+                                    'rules': [__ip_permission_rule(p) for p in grants],
+                                    'subcmd': subcmd,
+                                    'options': {group_option: group_name,
+                                                'ip_permissions': json.dumps(grants)}})
+                continue
+            for ec2_group_name, owner_id in grants or []:
+                if ec2_group_name and m.match(ec2_group_name):
+                    revocations.append({'service': service,
+                                        'region': region,
+                                        'security_group': group_name,
+                                        'rules': [ec2_group_name],
+                                        'subcmd': subcmd,
+                                        'options': {group_option: group_name,
+                                                    'ec2_security_group_name': ec2_group_name,
+                                                    'ec2_security_group_owner_id': owner_id}})
+    return revocations
+
+
 def revoke_all_ingress_rules(ec2profile='',
                              ec2regions=None,
                              filterby=None,
                              dry_run=False,
-                             verbose=False):
-    revoke_all_rds_ingress_rules_for_stage(ec2profile,
-                                           ec2regions,
-                                           filterby,
-                                           dry_run)
-    revoke_all_redshift_ingress_rules_for_stage(ec2profile,
-                                                ec2regions,
-                                                filterby,
-                                                dry_run)
-    revoke_all_elasticache_ingress_rules_for_stage(ec2profile,
-                                                   ec2regions,
-                                                   filterby,
-                                                   dry_run,
-                                                   verbose)
-    revoke_all_ec2_ingress_rules_for_stage(ec2profile,
-                                           ec2regions,
-                                           filterby,
-                                           dry_run)
+                             verbose=False,
+                             max_workers=8):
+    '''
+revoke_all_ingress_rules revokes rds, redshift, elasticache and ec2 ingress
+rules for a given stage environment.  The function takes these parameters,
+
+* ec2profile is an aws profile defined in ~/.aws/config
+* ec2regions is a list of AWS regions
+* filterby is a stage environment, i.e. stage3
+* dry_run reports what would be revoked.  ec2 calls are sent with --dry-run;
+  the other services do not support it and are not called
+* verbose prints every aws command executed
+* max_workers is how many revoke calls run at the same time
+
+the rules are collected by get_ingress_revocations, revoked concurrently, and
+a result table with one row per rule is printed to stderr.  The rows are also
+returned as a list of hashes with service, region, security_group, rule and
+status keys.
+    '''
+    revocations = get_ingress_revocations(ec2profile, ec2regions, filterby)
+
+    def revoke(index):
+        revocation = revocations[index]
+        if dry_run and revocation['service'] != 'ec2':
+            return 'dry-run'
+        try:
+            getattr(aws, revocation['service'])(revocation['subcmd'],
+                                                profile=ec2profile,
+                                                region=revocation['region'],
+                                                dry_run=dry_run,
+                                                verbose=verbose,
+                                                strict=True,
+                                                **revocation['options'])
+        except aws.DryRunError:
+            return 'dry-run'
+        return 'dry-run' if dry_run else 'revoked'
+
+    errors = {}
+    statuses = for_each(revoke,
+                        range(len(revocations)),
+                        max_workers=max_workers,
+                        errors=errors)
+
+    results = []
+    for index, revocation in enumerate(revocations):
+        status = statuses.get(index)
+        if index in errors:
+            # an awscli error carries the whole command line; its last line
+            # of stderr is the message
+            error = errors[index]
+            message = (getattr(error, 'stderr', None) or str(error)).strip()
+            status = 'failed: %s' % (message.splitlines() or [''])[-1]
+        for rule in revocation['rules']:
+            results.append({'service': revocation['service'],
+                            'region': revocation['region'],
+                            'security_group': revocation['security_group'],
+                            'rule': rule,
+                            'status': status})
+
+    for result in results:
+        print('{service:<12} {region:<10} {security_group:<40} {rule:<40} {status}'.format(**result),
+              file=sys.stderr)
+
+    return results
 
 if __name__ == '__main__':
     print('result from get_all_ec2_security_groups')
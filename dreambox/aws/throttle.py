@@ -0,0 +1,136 @@
+from __future__ import print_function
+import random
+import sys
+import threading
+import time
+
+# error codes AWS returns when a caller is making requests too fast
+THROTTLING_CODES = ('Throttling',
+                    'ThrottlingException',
+                    'ThrottledException',
+                    'RequestLimitExceeded',
+                    'RequestThrottled',
+                    'RequestThrottledException',
+                    'TooManyRequestsException',
+                    'ProvisionedThroughputExceededException',
+                    'SlowDown',
+                    'Rate exceeded')
+
+
+def is_throttling_error(err=None):
+    '''
+    return True if an exception raised by awscli (sh.ErrorReturnCode) or by
+    boto3 (botocore ClientError) is a throttling error
+    '''
+    response = getattr(err, 'response', None)
+    if isinstance(response, dict):
+        return response.get('Error', {}).get('Code') in THROTTLING_CODES
+
+    stderr = getattr(err, 'stderr', None)
+    if stderr is None:
+        return False
+    if not isinstance(stderr, str):
+        stderr = stderr.decode('utf-8', 'replace')
+    return any(code in stderr for code in THROTTLING_CODES)
+
+
+class TokenBucket(object):
+    '''
+TokenBucket allows rate calls per second on average, and bursts of up to
+burst calls.  acquire() blocks until a call is allowed.
+    '''
+
+    def __init__(self, rate=None, burst=None):
+        self.rate     = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self._tokens  = self.capacity
+        self._updated = time.time()
+        self._lock    = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RateLimiter(object):
+    '''
+RateLimiter runs aws calls through a token bucket per (service, region), and
+retries calls that fail with a throttling error using exponential backoff
+with full jitter.  The constructor takes these parameters,
+
+* rate is how many calls per second are allowed per (service, region).  If
+  it is None, calls are not rate limited, only retried
+* burst is how many calls can be made at once before rate applies
+* max_retries is how many times a throttled call is retried
+* base_delay is the backoff before the first retry in seconds; it doubles
+  with each retry
+* max_delay caps the backoff in seconds
+* verbose prints every retry to stderr
+    '''
+
+    def __init__(self,
+                 rate=None,
+                 burst=None,
+                 max_retries=5,
+                 base_delay=0.5,
+                 max_delay=20,
+                 verbose=False):
+        self.rate        = rate
+        self.burst       = burst
+        self.max_retries = max_retries
+        self.base_delay  = base_delay
+        self.max_delay   = max_delay
+        self.verbose     = verbose
+        self.retries     = 0
+        self._buckets    = {}
+        self._lock       = threading.Lock()
+
+    def bucket(self, key=None):
+        '''
+        return the token bucket of a (service, region) key, or None when
+        calls are not rate limited
+        '''
+        if not self.rate:
+            return None
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rate, self.burst)
+            return self._buckets[key]
+
+    def backoff(self, attempt=0):
+        '''
+        return how long to sleep before a given retry
+        '''
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, key=None, func=None, *args, **kwargs):
+        '''
+        call func(*args, **kwargs) under the limit of a (service, region)
+        key, retrying it while it is throttled
+        '''
+        bucket = self.bucket(key)
+        attempt = 0
+        while True:
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:
+                if attempt >= self.max_retries or not is_throttling_error(err):
+                    raise
+                delay = self.backoff(attempt)
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                if self.verbose:
+                    print('%s %s throttled, retry %d in %.2fs' % (key + (attempt, delay)),
+                          file=sys.stderr)
+                time.sleep(delay)
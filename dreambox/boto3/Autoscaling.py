@@ -4,17 +4,21 @@ import dreambox.utils
 from Aws import Aws
 from Aws import Tag
 
+# describe_auto_scaling_groups accepts up to 50 group names per request
+MAX_NAMES_PER_CALL = 50
+
 class Autoscaling(Aws):
-    def __init__(self, region=None, stack=None):
+    def __init__(self, region=None, stack=None, profile=None):
         '''
         A constructor to intialize an Autoscaling object. The constructor takes
         one parameter, 
         
         * region, which is a valid region define by AWS
         * stack is an stack to look for
+        * profile is a profile defined in ~/.aws/config
 
         '''
-        super(self.__class__, self).__init__(aws_client='autoscaling', region=region)
+        super(self.__class__, self).__init__(aws_client='autoscaling', region=region, profile=profile)
         self._stack = stack
 
     def __setattr__(self, name, value):
@@ -59,13 +63,10 @@ class Autoscaling(Aws):
         # iterates through each page and construct a list of hash tables
         # we use AutoScalingGroupName as a key, and store Instances and Tags object in its
         # own keys respectively: instances and tags
-        autoscaling_groups = []
-        for asg in self.paginator('describe_auto_scaling_groups').paginate():
-            autoscaling_group_infos = [{asg['AutoScalingGroupName']: {
-                    'instances': asg['Instances'],
-                    'tags': asg['Tags']}}
-                for asg in asg['AutoScalingGroups']]
-            autoscaling_groups += autoscaling_group_infos
+        autoscaling_groups = [{asg['AutoScalingGroupName']: {
+                'instances': asg['Instances'],
+                'tags': asg['Tags']}}
+            for asg in self._describe_auto_scaling_groups()]
 
         # if filter_by is not None, then we iterate through a list and
         # get the autoscaling group we are looking for
@@ -93,6 +94,63 @@ class Autoscaling(Aws):
 
         return self._get_all_autoscaling_groups(filter_by=stack)
 
+    def _describe_auto_scaling_groups(self, names=None):
+        '''
+        is a generator that yields every autoscaling group described by
+        describe_auto_scaling_groups, page by page. The method takes one
+        parameter,
+
+        * names is a list of autoscaling group names. If it is given, only
+          these groups are described, up to MAX_NAMES_PER_CALL names per
+          request. Otherwise every group in the region is described
+        '''
+        if names is None:
+            batches = [{}]
+        else:
+            names = list(names)
+            batches = [{'AutoScalingGroupNames': names[i:i + MAX_NAMES_PER_CALL]}
+                       for i in range(0, len(names), MAX_NAMES_PER_CALL)]
+
+        for batch in batches:
+            for page in self.paginator('describe_auto_scaling_groups').paginate(**batch):
+                for asg in page['AutoScalingGroups']:
+                    yield asg
+
+    def _get_instance_ids_for_stacks(self, stacks=None, names=None):
+        '''
+        return a hash of stack to instance ids for many stacks at once,
+
+            {
+                'stage3': ['i-0a1b2c3d', ...],
+                'stage7': [...]
+            }
+
+        all the stacks are resolved in one sweep of describe_auto_scaling_groups
+        instead of one full region scan per stack. An autoscaling group belongs
+        to a stack when the stack appears in its name (case insensitive). The
+        method takes these parameters,
+
+        * stacks is a list of chef stacks
+        * names is an optional list of autoscaling group names. When the names
+          are known, only these groups are described (in batches of
+          MAX_NAMES_PER_CALL)
+        '''
+        if stacks is None:
+            stacks = [self._stack]
+
+        wanted = [(stack, stack.lower()) for stack in stacks]
+        index = dict((stack, []) for stack in stacks)
+        for asg in self._describe_auto_scaling_groups(names=names):
+            asg_name = asg['AutoScalingGroupName'].lower()
+            instance_ids = None
+            for stack, lower in wanted:
+                if lower in asg_name:
+                    if instance_ids is None:
+                        instance_ids = [instance['InstanceId'] for instance in asg['Instances']]
+                    index[stack].extend(instance_ids)
+
+        return index
+
     def _get_instance_ids_for(self, stack=None):
         ''' 
         return all the instance ids for a given stack.
@@ -102,17 +160,7 @@ class Autoscaling(Aws):
         if stack is None:
             stack = self._stack
 
-        # first we retrieve all autoscaling groups for a given stack
-        autoscaling_groups = self._get_all_autoscaling_groups_for(stack=stack)
-
-        # now we extract InstanceId from each autoscaling group
-        instance_ids_list = []
-        for autoscaling_group in autoscaling_groups:
-            for asg_name, asg in autoscaling_group.items():
-                instances = asg['instances']
-                instance_ids_list += [instance['InstanceId'] for instance in instances]
-
-        return instance_ids_list
+        return self._get_instance_ids_for_stacks(stacks=[stack])[stack]
 
     def create_resources(self, stack=None):
         '''
@@ -133,17 +181,88 @@ class Autoscaling(Aws):
 
         return autoscaling_list
 
-    def suspend_processes(self):
+    def suspend_processes(self, scaling_processes=None):
         '''
-        suspend autoscaling processes
+        suspend autoscaling processes. The method takes one parameter,
+
+        * scaling_processes is a list of processes to suspend, i.e. Launch. If
+          it is None (by default), all processes are suspended
         '''
-        self._aws.suspend_process(AutoScalingGroupName=self.name())
+        self._aws.suspend_processes(**Autoscaling._processes_request(self.name, scaling_processes))
 
-    def resume_processes(self):
+    def resume_processes(self, scaling_processes=None):
         '''
-        resume autoscaling processes
+        resume autoscaling processes. The method takes one parameter,
+
+        * scaling_processes is a list of processes to resume. If it is None
+          (by default), all processes are resumed
         '''
-        self._aws.resume_process(AutoScalingGroupName=self.name())
+        self._aws.resume_processes(**Autoscaling._processes_request(self.name, scaling_processes))
+
+    def suspend_processes_for(self, names=None, scaling_processes=None, max_workers=None):
+        '''
+        suspend autoscaling processes of many autoscaling groups at once on a
+        pool of workers, and return a hash of group name to status,
+
+            {
+                'stage3-play-asg': 'suspended',
+                'stage3-web-asg': 'failed: ...'
+            }
+
+        The method takes these parameters,
+
+        * names is a list of autoscaling group names
+        * scaling_processes is a list of processes to suspend. If it is None
+          (by default), all processes are suspended
+        * max_workers is the largest number of groups handled at the same
+          time. If it is None, dreambox.aws.regions.DEFAULT_MAX_WORKERS is used
+        '''
+        return self._call_for_each_group(self._aws.suspend_processes,
+                                         'suspended',
+                                         names,
+                                         scaling_processes,
+                                         max_workers)
+
+    def resume_processes_for(self, names=None, scaling_processes=None, max_workers=None):
+        '''
+        resume autoscaling processes of many autoscaling groups at once. It
+        takes the same parameters and returns the same hash as
+        suspend_processes_for
+        '''
+        return self._call_for_each_group(self._aws.resume_processes,
+                                         'resumed',
+                                         names,
+                                         scaling_processes,
+                                         max_workers)
+
+    def _call_for_each_group(self, method=None, status=None, names=None, scaling_processes=None, max_workers=None):
+        '''
+        call a suspend or resume method once per autoscaling group
+        concurrently, and return a hash of group name to status
+        '''
+        from dreambox.aws.regions import for_each
+
+        names = list(names or [])
+        if not names:
+            raise ValueError('no autoscaling group names given')
+
+        def call(name):
+            method(**Autoscaling._processes_request(name, scaling_processes))
+            return status
+
+        errors = {}
+        statuses = for_each(call, names, max_workers=max_workers, errors=errors)
+        for name, err in errors.items():
+            statuses[name] = 'failed: %s' % err
+
+        return statuses
+
+    @staticmethod
+    def _processes_request(name=None, scaling_processes=None):
+        request = {'AutoScalingGroupName': name}
+        if scaling_processes:
+            request['ScalingProcesses'] = list(scaling_processes)
+        return request
 
     def create_or_update_tags(self, key=None, tags=None):
         '''
@@ -164,6 +283,37 @@ class Autoscaling(Aws):
         '''
         self._aws.create_or_update_tags(Tags=tags)
 
+    def create_or_update_tags_for(self, names=None, tags=None, propagate_at_launch=False):
+        '''
+        create or update the same tags on many autoscaling groups with a
+        single create_or_update_tags request, and return a hash of group name
+        to status ('tagged' or 'failed: ...'). The method takes these
+        parameters,
+
+        * names is a list of autoscaling group names
+        * tags is a hash of tag key to value, i.e. { 'frozen': 'true' }
+        * propagate_at_launch tells if new instances get the tags as well
+        '''
+        names = list(names or [])
+        if not names:
+            raise ValueError('no autoscaling group names given')
+        if not tags:
+            return dict((name, 'tagged') for name in names)
+
+        request = [{'ResourceId': name,
+                    'ResourceType': 'auto-scaling-group',
+                    'Key': key,
+                    'Value': value,
+                    'PropagateAtLaunch': propagate_at_launch}
+                   for name in names
+                   for key, value in sorted(tags.items())]
+        try:
+            self._aws.create_or_update_tags(Tags=request)
+        except Exception as err:
+            return dict((name, 'failed: %s' % err) for name in names)
+
+        return dict((name, 'tagged') for name in names)
+
     @staticmethod
     def _handle_instances(obj=None, instances=None):
         from Ec2 import EC2
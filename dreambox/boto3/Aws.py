@@ -1,4 +1,4 @@
-import boto3
+from ClientPool import pool
 import re
 
 class Aws(object):
@@ -7,23 +7,27 @@ class Aws(object):
     Service functions. This class wraps boto3 library to provide functionality
     to work in AWS platform.
     '''
-    def __init__(self, aws_client=None, region=None):
+    def __init__(self, aws_client=None, region=None, profile=None):
         '''
         The constructor that initializes access to various AWS service. After
         a service is initialized, a couple of private members are created for
-        used by a subclass. The constructor takes one parameter,
+        used by a subclass. The constructor takes these parameters,
 
         * region - a valid region defined by AWS. By default, this is none, and
                    the object will use your awscli configuration store at ~/.aws/config
                    file
+        * profile - a profile defined in ~/.aws/config. By default, this is none,
+                    and the default credentials are used
 
+        The boto3 client comes from a process wide ClientPool, so creating many
+        objects for the same service and region reuses one client.
         '''
-        self._aws          = boto3.client(aws_client, region)
+        self._profile      = profile
+        self._aws          = pool.client(aws_client, region, profile)
         self._paginator    = self._aws.get_paginator
         self._waiter       = self._aws.get_waiter
         self._can_paginate = self._aws.can_paginate
         self._meta         = self._aws.meta
-        self._resource     = boto3.resource
 
     def region_name(self):
         return self._meta.config.region_name
@@ -45,7 +49,7 @@ class Aws(object):
 
         * resource_name is a valid resource defined by boto3
         '''
-        return self._resource(resource_name, self.region_name())
+        return pool.resource(resource_name, self.region_name(), self._profile)
 
     @staticmethod
     def convert_case(name=None):
@@ -0,0 +1,108 @@
+import boto3
+import threading
+
+
+class ClientPool(object):
+    '''
+    ClientPool hands out boto3 clients and resources that are shared by every
+    Aws object in a process. Creating a client resolves endpoints and loads
+    the service model, so a client is created once per (service, region,
+    profile) and reused, together with its connection pool. Sessions are
+    created once per profile.
+
+    clients are thread safe and shared by all threads. boto3 resources are
+    not, so each thread gets its own resource objects (built from the shared
+    session).
+    '''
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self._sessions = {}
+        self._clients  = {}
+        self._local    = threading.local()
+
+    def session(self, profile=None):
+        '''
+        return the boto3 session of a profile. None uses the default
+        credential chain (environment, ~/.aws/config, instance profile)
+        '''
+        profile = profile or None
+        with self._lock:
+            if profile not in self._sessions:
+                self._sessions[profile] = boto3.session.Session(profile_name=profile)
+            return self._sessions[profile]
+
+    def client(self, service=None, region=None, profile=None):
+        '''
+        return a shared boto3 client. The method takes these parameters,
+
+        * service is a boto3 service name, i.e. autoscaling
+        * region is a valid region defined by AWS. None uses ~/.aws/config
+        * profile is a profile defined in ~/.aws/config
+        '''
+        key = (service, region or None, profile or None)
+        client = self._clients.get(key)
+        if client is None:
+            session = self.session(profile)
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = session.client(service, region_name=region or None)
+                    self._clients[key] = client
+        return client
+
+    def resource(self, service=None, region=None, profile=None):
+        '''
+        return a boto3 resource for the calling thread. It takes the same
+        parameters as client
+        '''
+        resources = getattr(self._local, 'resources', None)
+        if resources is None:
+            resources = self._local.resources = {}
+        key = (service, region or None, profile or None)
+        if key not in resources:
+            resources[key] = self.session(profile).resource(service, region_name=region or None)
+        return resources[key]
+
+    def evict(self, service=None, region=None, profile=None):
+        '''
+        close and forget the clients matching the given service, region and
+        profile. A parameter left as None matches anything, so evict()
+        drops every client. Resources of the calling thread are dropped the
+        same way.
+        '''
+        def matches(key):
+            return all(wanted is None or wanted == actual
+                       for wanted, actual in zip((service, region, profile), key))
+
+        with self._lock:
+            evicted = [key for key in self._clients if matches(key)]
+            clients = [self._clients.pop(key) for key in evicted]
+        for client in clients:
+            ClientPool._close(client)
+
+        resources = getattr(self._local, 'resources', {})
+        for key in [key for key in resources if matches(key)]:
+            del resources[key]
+
+        return evicted
+
+    def close(self):
+        '''
+        close every client and forget every session
+        '''
+        self.evict()
+        with self._lock:
+            self._sessions.clear()
+
+    @staticmethod
+    def _close(client=None):
+        # botocore clients can close their connection pool from 1.19 on
+        if hasattr(client, 'close'):
+            client.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+# the pool shared by every Aws object in this process
+pool = ClientPool()
@@ -5,7 +5,7 @@ class EC2(Aws):
     A class that provide an EC2 operations
     '''
 
-    def __init__(self, region=None, instance_ids=None):
+    def __init__(self, region=None, instance_ids=None, profile=None):
         '''
         A constructor to intialize an Autoscaling object. The constructor takes
         these parameters,
@@ -14,9 +14,11 @@ class EC2(Aws):
           ~/.aws/config
 
         * instance_id is a list of ec2 instance ids
+
+        * profile is a profile defined in ~/.aws/config
         '''
         # initialize object as an ec2 object
-        super(self.__class__, self).__init__(aws_client='ec2', region=region)
+        super(self.__class__, self).__init__(aws_client='ec2', region=region, profile=profile)
         self._instance_ids = []
         if instance_ids and type(instance_ids) is list:
             self._instance_ids = instance_ids
@@ -0,0 +1,163 @@
+from __future__ import print_function
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import tempfile
+import time
+
+# the layout of the cache file.  A file written with another version is
+# ignored and rebuilt
+CACHE_VERSION = 2
+
+# jobs the server lists without their parameter definitions keep the cached
+# ones when an expired cache is refreshed; once the jobs were last fetched in
+# full this many seconds ago, they are fetched in full again
+DEFAULT_REBUILD_AGE = 24 * 60 * 60
+
+
+class JobCache(object):
+    '''
+JobCache keeps the jobs of a jenkins server and their parameters in a json
+file, so jenkins-cmd does not have to ask the server for them on every run.
+Only plain job and parameter data is stored; the JobInfo objects are built
+again from it.  The file is written to a temporary file and renamed into
+place under an exclusive lock, so invocations running at the same time never
+read half a file.  The constructor takes these parameters,
+
+* path is the cache file; a .lock file is created next to it
+* url is the jenkins url the jobs belong to.  A file written for another
+  url is ignored
+* ttl is how many seconds the cached jobs are valid
+* rebuild_age is how many seconds after a full fetch of the jobs an expired
+  cache is fetched in full again instead of refreshed
+
+the file holds
+
+    { 'version': CACHE_VERSION, 'url': ..., 'created': epoch, 'rebuilt': epoch,
+      'jobs': { job name: { 'url': ..., 'parameters': [ parameter, ... ] } } }
+
+where a parameter is a hash of name, value, default, type and description.
+The sorted job names are also written to a .names file next to it, one per
+line, so tab completion can list them without reading the whole cache.
+    '''
+
+    def __init__(self, path=None, url='', ttl=300, rebuild_age=DEFAULT_REBUILD_AGE):
+        self.path        = path
+        self.url         = url
+        self.ttl         = ttl
+        self.rebuild_age = rebuild_age
+
+    @contextmanager
+    def locked(self):
+        '''
+        hold the cache file lock while the block runs
+        '''
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self):
+        '''
+        return the cached { job name: job } hash, or None if the file does
+        not exist, is expired, was written by another version or for another
+        server, or can not be read
+        '''
+        content = self.read()
+        if content is None or self.expired(content.get('created')):
+            return None
+        return content.get('jobs')
+
+    def load_stale(self):
+        '''
+        return (jobs, rebuilt) of an expired cache that can still be
+        refreshed, where rebuilt is when its jobs were last fetched in full.
+        (None, None) is returned when the jobs have to be fetched in full
+        '''
+        content = self.read()
+        if content is None:
+            return None, None
+        rebuilt = content.get('rebuilt')
+        if rebuilt is None or not 0 <= time.time() - rebuilt <= self.rebuild_age:
+            return None, None
+        return content.get('jobs'), rebuilt
+
+    def read(self):
+        '''
+        return the content of the cache file whether it is expired or not, or
+        None if the file does not exist, was written by another version or for
+        another server, or can not be read
+        '''
+        try:
+            with open(self.path, 'r') as fh:
+                content = json.load(fh)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not isinstance(content, dict) or \
+           content.get('version') != CACHE_VERSION or \
+           content.get('url') != self.url:
+            return None
+        return content
+
+    def expired(self, created=None):
+        '''
+        return True if a cache created at the epoch created is older than ttl
+        '''
+        if created is None:
+            return True
+        age = time.time() - created
+        return age < 0 or age > self.ttl
+
+    def save(self, jobs=None, rebuilt=None):
+        '''
+        write a { job name: job } hash to the cache file.  rebuilt is when
+        the jobs were last fetched in full; None means now
+        '''
+        now = time.time()
+        content = {'version': CACHE_VERSION,
+                   'url': self.url,
+                   'created': now,
+                   'rebuilt': rebuilt or now,
+                   'jobs': jobs}
+        self._write(self.path,
+                    lambda fh: json.dump(content, fh, separators=(',', ':'), sort_keys=True))
+        self._write(self.path + '.names',
+                    lambda fh: fh.writelines('%s\n' % name for name in sorted(jobs or {})))
+
+    def names(self):
+        '''
+        return the sorted job names of the last save, or None if there are
+        none.  Unlike load, names that are older than ttl are returned too
+        '''
+        try:
+            with open(self.path + '.names', 'r') as fh:
+                return [line.rstrip('\n') for line in fh if line.strip()]
+        except (IOError, OSError):
+            return None
+
+    def invalidate(self):
+        '''
+        remove the cache file and its job names
+        '''
+        for path in (self.path, self.path + '.names'):
+            if os.path.exists(path):
+                os.unlink(path)
+
+    def _write(self, path, write):
+        # write to a temporary file first, so a reader never sees half a file
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.jobs-')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                write(fh)
+            os.rename(tmp, path)
+        except:
+            os.unlink(tmp)
+            raise
@@ -5,19 +5,36 @@ from xmljson import BadgerFish
 from xml.etree.ElementTree import fromstring
 import json
 import dreambox.jenkins
+import dreambox.jenkins.cache
 import dreambox.jenkins.jobinfo
 from dreambox.jenkins.parameter import Parameter, ParameterMap
+from multiprocessing.pool import ThreadPool
 
 import os
 import errno
 import datetime
+import threading
 
-# if cPickle is available the include it; otherwise
-# use pure Python implementation
 try:
-    import cPickle as pickle
-except:
-    import pickle
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+# requests gives the job workers a shared keep-alive connection pool; without
+# it they go through python-jenkins
+try:
+    import requests
+except ImportError:
+    requests = None
+
+# the parameter definitions of a job, and the jobs of a folder level together
+# with their parameter definitions, as jenkins tree= queries
+PROPERTY_TREE = 'property[parameterDefinitions[name,type,description,value,choices,defaultParameterValue[value]]]'
+JOBS_TREE_QUERY = '?tree=jobs[name,url,jobs[name],%s]' % PROPERTY_TREE
+
+# how many job requests are made at the same time when the tree query can
+# not be used
+DEFAULT_MAX_WORKERS = 8
 
 class JenkinsParameterError(Exception):
     def __init__(self, message):
@@ -45,8 +62,12 @@ class Jenkins(object):
         self._passwd  = jenkins_pass if jenkins_pass else self._config['password']
         self._url     = jenkins_url if jenkins_url else self._config['url']
         self._jobs    = dict()
-        self._server  = jenkins.Jenkins(self.url, self.user, self._passwd)
+        self._connection = None
         self._bf      = BadgerFish()
+        self._session = None
+        self._crumb_header = None
+        self._crumb_lock = threading.Lock()
+        self.max_workers = DEFAULT_MAX_WORKERS
 
     @property
     def config_file(self):
@@ -80,19 +101,193 @@ class Jenkins(object):
     def url(self, value):
         self._url = value
 
+    @property
+    def _server(self):
+        # connect on first use, so jobs loaded from the cache do not need a
+        # connection until one of them talks to the server
+        if self._connection is None:
+            self._connection = jenkins.Jenkins(self.url, self.user, self._passwd)
+        return self._connection
+
     @property
     def server(self):
         return self._server.server
 
-    def _get_jobs(self):
+    def _get_jobs(self, known=None):
+        '''
+        return { job name: Job }, fetching the jobs once.  known is an
+        optional { job name: job } hash read by JobCache; a job the server
+        lists without its parameter definitions keeps the known ones instead
+        of being fetched again
+        '''
         if len(self._jobs) == 0:
-            for job in self._server.get_all_jobs():
+            jobs = self._get_jobs_with_parameters(known)
+            for job in jobs:
                 job_name             = job['name']
                 job_url              = job['url']
-                job_parameters       = self._get_job_parameters(job_name)
+                if job['property'] is None:
+                    job_parameters   = self._cached_parameters(known[job_name]['parameters'])
+                else:
+                    job_parameters   = self._parse_job_parameters(job['property'])
                 self._jobs[job_name] = dreambox.jenkins.jobinfo.Job(job_name, job_url, job_parameters)
         return self._jobs
 
+    def _get_jobs_with_parameters(self, known=None):
+        '''
+        return every job with its name, url and property list. The jobs and
+        their parameter definitions come from one tree= scoped query per
+        folder level. Jobs the query could not describe (an older server, or
+        an error) have their properties fetched by a bounded pool of workers,
+        except the ones in the known { job name: job } hash; their property
+        is None, and the caller uses the known parameters
+        '''
+        try:
+            jobs, missing = self._query_jobs_tree()
+        except jenkins.JenkinsException:
+            jobs, missing = [], [{'name': job['name'],
+                                  'url': job['url'],
+                                  'fullname': job.get('fullname', job['name'])}
+                                 for job in self._server.get_all_jobs()]
+
+        if known:
+            for job in [job for job in missing if job['name'] in known]:
+                job['property'] = None
+                jobs.append(job)
+            missing = [job for job in missing if job['name'] not in known]
+
+        if missing:
+            properties = self._fetch_job_properties([job['fullname'] for job in missing])
+            for job in missing:
+                job['property'] = properties[job['fullname']]
+            jobs.extend(missing)
+
+        return jobs
+
+    def _query_jobs_tree(self):
+        '''
+        walk the jobs of the server the same way python-jenkins get_all_jobs
+        does, asking for the parameter definitions in the same request.
+        return (jobs, missing), where missing are the jobs returned without a
+        property list
+        '''
+        jobs, missing = [], []
+        # (folder path, folder full name, jobs of the folder)
+        levels = [('', '', self._server.get_info(query=JOBS_TREE_QUERY)['jobs'])]
+        for path, prefix, level_jobs in levels:
+            for job in level_jobs:
+                fullname = prefix + job['name']
+                if 'jobs' in job:  # folder
+                    folder_path = '/job/'.join((path, job['name']))
+                    levels.append((folder_path,
+                                   fullname + '/',
+                                   self._server.get_info(folder_path, query=JOBS_TREE_QUERY)['jobs']))
+                elif 'property' in job:
+                    jobs.append({'name': job['name'], 'url': job['url'], 'property': job['property']})
+                else:
+                    missing.append({'name': job['name'], 'url': job['url'], 'fullname': fullname})
+        return jobs, missing
+
+    def _fetch_job_properties(self, job_names=None):
+        '''
+        return { job name: property list } for a list of jobs, fetched
+        concurrently by at most max_workers requests at a time. When
+        requests is installed, the workers share one keep-alive session;
+        otherwise python-jenkins get_job_info is used.
+        '''
+        session = self._http_session()
+
+        def fetch(job_name):
+            if session is None:
+                return job_name, self._server.get_job_info(job_name)['property']
+            url = '%s/job/%s/api/json' % (self.url.rstrip('/'),
+                                          '/job/'.join(quote(part) for part in job_name.split('/')))
+            response = session.get(url, params={'tree': PROPERTY_TREE})
+            response.raise_for_status()
+            return job_name, response.json().get('property', [])
+
+        return dict(self._map(fetch, job_names))
+
+    def _map(self, func=None, items=None, max_workers=None):
+        '''
+        return [ func(item), ... ] for a list of items, calling func from at
+        most max_workers (self.max_workers by default) threads at a time
+        '''
+        max_workers = max_workers or self.max_workers
+        if len(items) <= 1 or max_workers <= 1:
+            return [func(item) for item in items]
+
+        pool = ThreadPool(min(max_workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _http_session(self):
+        '''
+        return a requests session with a connection pool as large as
+        max_workers, or None when requests is not installed
+        '''
+        if requests is None:
+            return None
+        if self._session is None:
+            session = requests.Session()
+            session.auth = (self.user, self._passwd)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                    pool_maxsize=self.max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def _crumb(self):
+        '''
+        return the CSRF crumb header jenkins wants on a POST, or {} if the
+        server does not issue crumbs
+        '''
+        # bulk job workers all ask for it; only the first one fetches it
+        with self._crumb_lock:
+            if self._crumb_header is None:
+                response = self._http_session().get('%s/crumbIssuer/api/json' % self.url.rstrip('/'))
+                if response.status_code == 404:
+                    self._crumb_header = {}
+                else:
+                    response.raise_for_status()
+                    crumb = response.json()
+                    self._crumb_header = {crumb['crumbRequestField']: crumb['crumb']}
+            return self._crumb_header
+
+    def _job_action(self, job_name='', job_url='', action=''):
+        '''
+        run an action on a job and return the response text. This method
+        takes these parameters,
+
+        * job_name is the name of the job
+        * job_url is the url of the job, which is used with the shared session
+        * action is config.xml (read the job configuration), enable or disable
+        '''
+        session = self._http_session()
+        if session is None:
+            actions = {'config.xml': 'get_job_config',
+                       'enable': 'enable_job',
+                       'disable': 'disable_job'}
+            return getattr(self._server, actions[action])(job_name)
+
+        url = '%s/%s' % (job_url.rstrip('/'), action)
+        if action == 'config.xml':
+            response = session.get(url)
+        else:
+            response = session.post(url, headers=self._crumb())
+        response.raise_for_status()
+        return response.text
+
+    def _get_view_jobs(self, view=''):
+        '''
+        return the names of the jobs in a jenkins view
+        '''
+        view_jobs = self._server.get_info('view/%s' % quote(view), query='?tree=jobs[name]')['jobs']
+        return [job['name'] for job in view_jobs]
+
     @property
     def name(self):
         '''
@@ -101,11 +296,18 @@ class Jenkins(object):
         return self._name
 
     def _get_job_parameters(self, job_name=''):
+        return self._parse_job_parameters(self._server.get_job_info(job_name)['property'])
+
+    def _parse_job_parameters(self, job_property=None):
+        '''
+        turn the property list of a job into a ParameterMap
+        '''
         params                 = {}
         parameters             = ParameterMap()
-        job_property           = self._server.get_job_info(job_name)['property']
         parameter_definitions  = None
-        if job_property and 'parameterDefinitions' in job_property[0]:
+        # a job lists its parameters in the first property that has them
+        job_property = [p for p in job_property or [] if p and 'parameterDefinitions' in p]
+        if job_property:
             parameter_definitions = job_property[0]['parameterDefinitions']
             for p in parameter_definitions:
                 p_name          = p['name']
@@ -113,14 +315,14 @@ class Jenkins(object):
                 p_default       = ''
                 p_value         = ''
                 params['name']  = p['name']
-                if 'defaultParameterValue' in p and \
+                if p.get('defaultParameterValue') and \
                    'value' in p['defaultParameterValue']:
                     p_default = p['defaultParameterValue']['value']
                 if 'Choice' in p_type:
                     p_value = p['choices']
                 else:
                     p_value = p['value'] if 'value' in p else ''
-                p_description = p['description']
+                p_description = p.get('description')
                 p = Parameter(p_name,
                               p_value,
                               p_default,
@@ -160,61 +362,98 @@ class Jenkins(object):
     @classmethod
     def create_jobinfomap(self, object=None, cache_timeout=5):
         '''
-        will create a JobInfoMap container object. The method takes one parameter
-
-        * object which is a type of JobInfo
-
-        the class method will cache the JobInfoMap object via cPickle. it will also
-        invalidate the cache file in 5 minutes.
-        '''
-        load_from_pickle = False
-        def _create_jobinfomap():
-            jobinfomap = dreambox.jenkins.jobinfo.JobInfoMap()
-            for job in object._get_jobs():
-                jobinfo                  = dreambox.jenkins.jobinfo.JobInfo(object)
-                jobinfo._name            = job
-                jobinfo._url             = object._get_jobs()[job].url
-                parameters               = object._get_jobs()[job].parameters
-                jobinfo._parameters      = parameters
-                jobinfomap[jobinfo.name] = jobinfo
-                if 'dry_run' in parameters:
-                    jobinfo._has_dryrun = True
-            return jobinfomap
-
-        current_dir = os.path.curdir
-        workspace   = os.path.join(current_dir, 'tmp')
-        if not os.path.exists(workspace):
-            print('create directory %s' % workspace)
-            os.mkdir(workspace)
-        pickle_file       = os.path.join(workspace, '%s.pickle' % object.name)
-        pickle_filehandle = None
-        jobinfomap        = None
-        pickle_filehandle = None
-        if os.path.exists(pickle_file) and \
-                Jenkins.timediff_in_secs(Jenkins.mdate(pickle_file),
-                        datetime.datetime.now()) > (cache_timeout * 60):
-            print('pickle file expired, regenerating it')
-            os.unlink(pickle_file)
-
-        try:
-            if not os.path.exists(pickle_file):
-                pickle_filehandle = open(pickle_file, 'w+b')
-            else:
-                pickle_filehandle = open(pickle_file, 'r+b')
-                load_from_pickle  = True
-            jobinfomap = None
-            if load_from_pickle:
-                print('reloading object')
-                jobinfomap = pickle.load(pickle_filehandle)
-                jobinfomap.establish_object_connections()
+        will create a JobInfoMap container object. The method takes these parameters
+
+        * object which is a type of dreambox.jenkins.core.Jenkins
+        * cache_timeout is how many minutes the cached jobs are valid
+
+        the jobs and their parameters are cached in ./tmp/<section>.json (see
+        dreambox.jenkins.cache.JobCache), so a run within cache_timeout minutes
+        of the last one builds the JobInfoMap from that file without asking
+        the jenkins server. Regenerating an expired cache is the single
+        tree= query per folder level of _get_jobs, so every job is refreshed
+        for the same cost as listing the job names. When a server can not
+        answer that query and the jobs are listed one request per job
+        instead, only the jobs that are new since the cache was written are
+        fetched, until the jobs are a day old (see JobCache.rebuild_age) and
+        fetched in full again.
+        '''
+        cache = object._job_cache(cache_timeout)
+        with cache.locked():
+            jobs = cache.load()
+            if jobs is not None:
+                object._set_cached_jobs(jobs)
             else:
-                jobinfomap = _create_jobinfomap()
-                pickle.dump(jobinfomap, pickle_filehandle)
-        finally:
-            pickle_filehandle.close()
+                print('job cache expired, regenerating it')
+                known, rebuilt = cache.load_stale()
+                object._get_jobs(known)
+                cache.save(object._get_cached_jobs(), rebuilt)
+
+        jobinfomap = dreambox.jenkins.jobinfo.JobInfoMap()
+        for job in object._get_jobs():
+            jobinfo                  = dreambox.jenkins.jobinfo.JobInfo(object)
+            jobinfo._name            = job
+            jobinfo._url             = object._get_jobs()[job].url
+            parameters               = object._get_jobs()[job].parameters
+            jobinfo._parameters      = parameters
+            jobinfomap[jobinfo.name] = jobinfo
+            if 'dry_run' in parameters:
+                jobinfo._has_dryrun = True
 
         return jobinfomap
 
+    def cached_job_names(self):
+        '''
+        return the sorted job names create_jobinfomap cached last, or None
+        if nothing is cached.  The jenkins server is not asked, so the names
+        may be older than the cache timeout
+        '''
+        return self._job_cache().names()
+
+    def _job_cache(self, cache_timeout=5):
+        workspace = os.path.join(os.path.curdir, 'tmp')
+        return dreambox.jenkins.cache.JobCache(os.path.join(workspace, '%s.json' % self.name),
+                                               url=self.url,
+                                               ttl=cache_timeout * 60)
+
+    def _get_cached_jobs(self):
+        '''
+        return the jobs as the plain hash JobCache stores
+        '''
+        jobs = {}
+        for job_name, job in self._get_jobs().items():
+            parameters = [{'name': p.name,
+                           'value': p.value,
+                           'default': p.default,
+                           'type': p.type,
+                           'description': p.description}
+                          for p in (job.parameters[name] for name in job.parameters)]
+            jobs[job_name] = {'url': job.url, 'parameters': parameters}
+        return jobs
+
+    def _set_cached_jobs(self, jobs=None):
+        '''
+        replace the jobs with the ones read by JobCache
+        '''
+        self._jobs = dict()
+        for job_name, job in jobs.items():
+            parameters = self._cached_parameters(job['parameters'])
+            self._jobs[job_name] = dreambox.jenkins.jobinfo.Job(job_name, job['url'], parameters)
+
+    @staticmethod
+    def _cached_parameters(parameters=None):
+        '''
+        return a ParameterMap for a list of parameters read by JobCache
+        '''
+        parameter_map = ParameterMap()
+        for p in parameters:
+            parameter_map[p['name']] = Parameter(p['name'],
+                                                 p['value'],
+                                                 p['default'],
+                                                 p['type'],
+                                                 p['description'])
+        return parameter_map
+
     @staticmethod
     def mdate(filename):
         mtime = os.path.getmtime(filename)
@@ -222,7 +461,7 @@ class Jenkins(object):
                                                       
     @staticmethod
     def timediff_in_secs(t1, t2):
-        return (t2 - t1).seconds
+        return int((t2 - t1).total_seconds())
 
     @staticmethod
     def mkdir_p(path):
@@ -3,7 +3,10 @@ from collections import Sequence
 import dreambox.jenkins.core
 import dreambox.utils
 import jenkins
+import io
 import os
+import tarfile
+import time
 
 
 class Job(object):
@@ -29,7 +32,7 @@ class JobInfo(object):
         if not type(object) is dreambox.jenkins.core.Jenkins:
             raise TypeError('%s has to be a type of Jenkins' % object.__class__)
         self._parent     = object
-        self._jenkins    = self._parent._server
+        self._connection = None
         self._name       = ''
         self._url        = ''
         self._parameters = {}
@@ -39,6 +42,17 @@ class JobInfo(object):
         self._return_xml_python_struct = False
         self._section = self._parent.name
 
+    @property
+    def _jenkins(self):
+        # the server connection of the parent, made when a job first needs it
+        if self._connection is None:
+            self._connection = self._parent._server
+        return self._connection
+
+    @_jenkins.setter
+    def _jenkins(self, value):
+        self._connection = value
+
     @property
     def name(self):
         '''
@@ -333,3 +347,100 @@ class JobInfoMap(dict):
 
         for jobinfo in self:
             self[jobinfo]._jenkins = _jenkins
+
+    def select_jobs(self, pattern=None, view=None):
+        '''
+        return the sorted names of the jobs matching a regex pattern and, if
+        view is given, in that jenkins view. None for both selects every job
+        '''
+        names = sorted(self)
+        if pattern is not None:
+            regex = dreambox.utils.compile_regex(pattern)
+            names = [name for name in names if regex.search(name)]
+        if view is not None and names:
+            in_view = set(self[names[0]]._parent._get_view_jobs(view))
+            names = [name for name in names if name in in_view]
+        return names
+
+    def _for_each_job(self, func=None, names=None, max_workers=None):
+        '''
+        call func(jobinfo) for each of the named jobs, from a bounded pool of
+        threads sharing the http session of the parent, and return
+        { job name: result }, where a job that raised gets 'failed: <error>'
+        '''
+        if not names:
+            return {}
+
+        def call(name):
+            try:
+                return name, func(self[name])
+            except Exception as error:
+                return name, 'failed: %s' % error
+
+        return dict(self[names[0]]._parent._map(call, names, max_workers))
+
+    def enable_jobs(self, pattern=None, view=None, dry_run=True, max_workers=None):
+        '''
+        enable the jobs selected by pattern and view (see select_jobs), and
+        return { job name: 'enabled' | 'dry-run' | 'failed: ...' }
+        '''
+        return self._set_jobs_state('enable', pattern, view, dry_run, max_workers)
+
+    def disable_jobs(self, pattern=None, view=None, dry_run=True, max_workers=None):
+        '''
+        disable the jobs selected by pattern and view (see select_jobs), and
+        return { job name: 'disabled' | 'dry-run' | 'failed: ...' }
+        '''
+        return self._set_jobs_state('disable', pattern, view, dry_run, max_workers)
+
+    def _set_jobs_state(self, action='', pattern=None, view=None, dry_run=True, max_workers=None):
+        def set_state(jobinfo):
+            if dry_run:
+                return 'dry-run'
+            jobinfo._parent._job_action(jobinfo.name, jobinfo.url, action)
+            return '%sd' % action
+
+        return self._for_each_job(set_state, self.select_jobs(pattern, view), max_workers)
+
+    def save_job_configs(self, workspace='tmp', pattern=None, view=None, archive=None, max_workers=None):
+        '''
+        save the config.xml of the jobs selected by pattern and view (see
+        select_jobs), and return { job name: path | 'failed: ...' }. The
+        method takes these parameters,
+
+        * workspace is the directory the <job>.config.xml files are written to
+        * archive is an optional .tar.gz file.  When it is given, the configs
+          go into that one archive, under <section>/<job>.config.xml, instead
+          of workspace
+        * max_workers is how many configs are fetched at the same time
+        '''
+        names = self.select_jobs(pattern, view)
+        if archive is None:
+            def save(jobinfo):
+                config = jobinfo._parent._job_action(jobinfo.name, jobinfo.url, 'config.xml')
+                dreambox.jenkins.core.Jenkins.mkdir_p(workspace)
+                fullpath = os.path.join(workspace, '%s.config.xml' % jobinfo.name)
+                with open(fullpath, 'w') as configh:
+                    configh.write(config.encode('utf-8') if isinstance(config, unicode) else config)
+                return fullpath
+            return self._for_each_job(save, names, max_workers)
+
+        # tarfile is not thread safe, so the workers only fetch, and the
+        # configs are added to the archive here
+        def fetch(jobinfo):
+            config = jobinfo._parent._job_action(jobinfo.name, jobinfo.url, 'config.xml')
+            return config.encode('utf-8') if isinstance(config, unicode) else config
+        configs = self._for_each_job(fetch, names, max_workers)
+
+        results = {}
+        with tarfile.open(archive, 'w:gz') as tar:
+            for name in names:
+                if configs[name].startswith('failed: '):
+                    results[name] = configs[name]
+                    continue
+                member = tarfile.TarInfo('%s/%s.config.xml' % (self[name].section, name))
+                member.size  = len(configs[name])
+                member.mtime = time.time()
+                tar.addfile(member, io.BytesIO(configs[name]))
+                results[name] = '%s:%s' % (archive, member.name)
+        return results
@@ -1,11 +1,11 @@
 from __future__ import print_function
-from funcy.seqs import pairwise
 import dreambox.aws.security
 import dreambox.aws.cloudformation
 import os
 import dreambox.utils
 import re
 import sys
+import time
 
 import dreambox.aws.autoscaling as asg
 import dreambox.aws.ec2 as ec2
@@ -16,50 +16,48 @@ get_available_stack_from_all_regions will return first available stack
 environment from all regions.  The function takes these parameters,
 
   aws_profile is a profile defined in ~/.aws/config
+  lease_file is an optional lease file.  When it is given, the slot picked is
+    leased in the file, so jobs running at the same time get different slots
 
-This function will search a given set of regions and return the first
-available stack and return it as a hash of array back to caller
+This function will search a given set of regions (concurrently) and return
+the first available stack of every region as a hash back to caller.  The
+region with the lowest free slot is written to build.properties.  When no
+region could be searched, nothing is written and the program exits with an
+error.  Leases of slots whose stack exists by now are dropped from the lease
+file; release_stack_slot drops one by hand.
     '''
 
     from dreambox.aws.cloudformation import get_stack_names_from_all_regions
+    from dreambox.ops.stack_slots import SlotLeases, find_free_slots, pick_slot
     aws_profile = ''
+    lease_file = None
     if args is not None:
        aws_profile = args.profile
+       lease_file = getattr(args, 'lease_file', None)
     if aws_profile is None:
       aws_profile = ''
-    # get all the stacks from every region. at this point, we don't want
-    # anything but the number attaches to the stack name
+
+    # get all the stack names from every region, and find the lowest slot
+    # that is neither used by a stack nor leased by another job
     region_stacks = get_stack_names_from_all_regions(profile=aws_profile)
-    m = re.compile(r'\w+(\d)', re.IGNORECASE)
-    def get_number(n):  # this is a callback function we filter out number
-        found = m.match(n)
-        if found:
-            return ord(found.group(1)) - 48
-
-    def get_free_stack_from_a_slot(region=[]):
-        available_slot = None
-
-        paired_list = pairwise(region)
-        for pair in paired_list:
-            if pair[1] - pair[0] > 1:
-                available_slot = pair[0] + 1
-                break
-        return available_slot
-
-    # go through the hash and collect the right pattern we want. we also sort
-    # the list and calculate the first avaiable stack environment by calling
-    # get_free_stack_from_a_slot private function.  The result is stored at
-    # region_available_slot hash
-    region_available_slot = {}
-    region_stack_slots = {}
-    available_slot = None
-    my_region, my_slot = None, None
-    for region, stacks in region_stacks.items():
-        region_stack_slots[region] = sorted(map(get_number, stacks))
-        available_slot = get_free_stack_from_a_slot(region_stack_slots[region])
-        region_available_slot[region] = "Stage{0}".format(available_slot)
-        my_region, my_slot = region, region_available_slot[region].lower()
-        break
+    if lease_file:
+        leases = SlotLeases(lease_file)
+        with leases.locked():
+            leases.reclaim(region_stacks)
+            free_slots = find_free_slots(region_stacks, leases)
+            my_region, available_slot = pick_slot(free_slots)
+            if my_region is not None:
+                leases.acquire(my_region, available_slot)
+    else:
+        free_slots = find_free_slots(region_stacks)
+        my_region, available_slot = pick_slot(free_slots)
+
+    if my_region is None:
+        sys.exit('no region could be searched for an available stack')
+
+    region_available_slot = dict((region, "Stage{0}".format(slot))
+                                 for region, slot in free_slots.items())
+    my_slot = "stage{0}".format(available_slot)
 
     build_properties_path = ''
     workspace = os.getcwd()
@@ -75,6 +73,30 @@ available stack and return it as a hash of array back to caller
     sys.stdout.write("region slot -> {0}:{1}".format(my_region, my_slot))
     return region_available_slot
 
+def release_stack_slot(args=None):
+    '''
+release_stack_slot ends the lease of a stage slot in a lease file, i.e. when
+a job that got the slot from get_available_stack_from_all_regions gives up
+before its stack is created.  The function takes these parameters,
+
+  stage is a stage stack name, i.e. stage3
+  lease_file is the lease file get_available_stack_from_all_regions used
+    '''
+    from dreambox.ops.stack_slots import SlotLeases, stage_number
+    if args.lease_file is None:
+        sys.exit('a lease file is required')
+    slot = stage_number(args.stage)
+    if slot is None:
+        sys.exit('%s is not a stage name' % args.stage)
+
+    leases = SlotLeases(args.lease_file)
+    with leases.locked():
+        released = leases.release(slot)
+    if released:
+        print('released stage%d' % slot, file=sys.stderr)
+    else:
+        print('stage%d was not leased' % slot, file=sys.stderr)
+
 def revoke_all_ingress_rules_for_stage(args=None):
     from dreambox.aws.security import revoke_all_ingress_rules
     revoke_all_ingress_rules(filterby=args.stage, verbose=args.verbose, dry_run=args.dry_run)
@@ -142,18 +164,56 @@ def add_security_group_to_instances(args=None):
 
 
 def resume_autoscaling_group_for(args=None):
-    profile = args.profile
-    region  = args.region
-    stage   = args.stage
-    verbose = args.verbose
-    dry_run = args.dry_run
+    profile     = args.profile
+    region      = args.region
+    stage       = args.stage
+    verbose     = args.verbose
+    dry_run     = args.dry_run
+    max_workers = args.max_workers
+    wait        = args.wait
     if profile is None:
         profile=''
-    asg.resume_autoscaling_group_for_stage(profile=profile,
-                                           region=region,
-                                           stage=stage,
-                                           verbose=verbose,
-                                           dry_run=dry_run)
+
+    def progress(row, done, total):
+        print('[%d/%d] %s %s in %.2fs' % (done, total, row['asg'], row['status'], row['seconds']),
+              file=sys.stderr)
+
+    start = time.time()
+    rows = asg.resume_autoscaling_group_for_stage(profile=profile,
+                                                  region=region,
+                                                  stage=stage,
+                                                  verbose=verbose,
+                                                  dry_run=dry_run,
+                                                  parallel=max_workers > 1,
+                                                  max_workers=max_workers,
+                                                  wait=wait,
+                                                  progress=progress)
+    print_latency_summary(rows, time.time() - start)
+
+
+def print_latency_summary(rows=None, elapsed=0):
+    '''
+print_latency_summary will print how many autoscaling groups succeeded or
+failed, and the p50, p95 and max latency of the calls.  The function takes
+these parameters,
+
+* rows is a list of { 'asg': name, 'status': status, 'seconds': latency }
+* elapsed is the wall clock time of the whole operation in seconds
+    '''
+    if not rows:
+        print('no autoscaling groups found', file=sys.stderr)
+        return
+
+    latencies = sorted(row['seconds'] for row in rows)
+    def percentile(pct):
+        return latencies[int(round((pct / 100.0) * (len(latencies) - 1)))]
+
+    failed = [row for row in rows if row['status'].startswith(('failed', 'timed out'))]
+    print('%d groups, %d ok, %d failed in %.2fs (p50 %.2fs, p95 %.2fs, max %.2fs)' %
+          (len(rows), len(rows) - len(failed), len(failed), elapsed,
+           percentile(50), percentile(95), latencies[-1]), file=sys.stderr)
+    for row in failed:
+        print('  %s: %s' % (row['asg'], row['status']), file=sys.stderr)
 
 if __name__ == '__main__':
 
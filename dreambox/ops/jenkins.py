@@ -1,7 +1,10 @@
 from __future__ import print_function
 from dreambox.jenkins.core import Jenkins
+import dreambox.jenkins.jobinfo
 import argparse, argcomplete
+import bisect
 import types
+import sys
 import os
 
 def jenkins():
@@ -17,10 +20,6 @@ def jenkins():
                                            formatter_class=argparse.ArgumentDefaultsHelpFormatter,
                                            argument_default=argparse.SUPPRESS)
 
-
-    # setup argcomplete
-    argcomplete.autocomplete(optionparser)
-
     # mark jobinfomap global makes command line function hook much more easy
     # to access JobInfoMap object
     global jobinfomap
@@ -40,7 +39,7 @@ def jenkins():
 
     args = optionparser.parse_known_args()
 
-    # create object and cache it if the pickle file does not exist
+    # create object, its jobs come from the job cache while it is fresh
     global jenkins
     jenkins = Jenkins(args[0].jenkins_url,
                       args[0].jenkins_user,
@@ -48,64 +47,60 @@ def jenkins():
                       args[0].jenkins_config_filename,
                       args[0].jenkins_config_filepath,
                       args[0].jenkins_config_section)
-    jobinfomap = Jenkins.create_jobinfomap(jenkins, args[0].jenkins_cache_timeout)
+    command, prefix = find_command(optionparser, args[1])
+
+    # a tab completion runs on every tab press.  It lists the job names
+    # from the names the job cache keeps, and only loads the jobs when the
+    # options of a job are completed.  Whatever loading the jobs prints is
+    # kept off stdout, where argcomplete writes the completions
+    jobnames = None
+    if '_ARGCOMPLETE' in os.environ:
+        jobnames = jenkins.cached_job_names()
+    if jobnames is not None and \
+       (command is None or command not in job_names_with_prefix(jobnames, command)):
+        jobinfomap = dreambox.jenkins.jobinfo.JobInfoMap()
+    elif '_ARGCOMPLETE' in os.environ:
+        with argcomplete.mute_stdout():
+            jobinfomap = Jenkins.create_jobinfomap(jenkins, args[0].jenkins_cache_timeout)
+    else:
+        jobinfomap = Jenkins.create_jobinfomap(jenkins, args[0].jenkins_cache_timeout)
 
-    # build command line options based on our container object, and activate it
-    cmd_parser = build_cmdline_options(optionparser, jobinfomap)
+    # build command line options based on our container object, only the
+    # given job gets its options, and activate it
+    cmd_parser = build_cmdline_options(optionparser, jobinfomap, command, prefix, jobnames)
+
+    # setup argcomplete once the subcommands are known
+    argcomplete.autocomplete(cmd_parser)
     args       = cmd_parser.parse_args()
     args.func(args)
 
-def build_cmdline_options(optionparser, jobinfos=None):
+def build_cmdline_options(optionparser, jobinfos=None, command=None, prefix=None, jobnames=None):
     '''
     is a function that builds out jenkins command and command
     line options base on what's available from jenkins server.
-    This function takes only one parameter,
-
-    * jobinfos is a type of JobInfos
-    '''
-    # create sub parser objects and declare some variables
-    subparsers  = optionparser.add_subparsers()
-    opt_name    = ''
-    opt_default = ''
-    opt_help    = ''
-    opt_choices = None
-
-    # now iterates through a jobinfos container
-    for jobinfo in jobinfos:
-        # create a parser for subcommand
-        subparser = subparsers.add_parser(jobinfo,
-                                          help=jobinfo.replace('_', ' '),
-                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-        if not jobinfos[jobinfo].has_dryrun:
-            subparser.add_argument('--dry_run',
-                                   help='see what job do without executing it, True by default',
-                                   action='store_true',
-                                   default=True)
-
-        # get job parameters and iterate through them to build subcommand options
-        params = jobinfos[jobinfo].parameters
-        for param in params:
-            opt_type = params[param].type
-            if not 'Separator' in opt_type:
-                opt_name    = '--%s' % param
-                opt_default = params[param].default
-                opt_help    = params[param].description
-                opt_choices = params[param].value if 'Choice' in opt_type else None
-                if opt_choices:
-                    if 'Required' in opt_default:
-                        subparser.add_argument(opt_name,
-                                               choices=opt_choices,
-                                               required=True,
-                                               default=opt_default)
-                    else:
-                        subparser.add_argument(opt_name,
-                                               choices=opt_choices,
-                                               default=opt_default)
-                else:
-                    subparser.add_argument(opt_name,
-                                           help=opt_help,
-                                           default=opt_default)
-                subparser.set_defaults(func=jobinfos[jobinfo].build)
+    This function takes these parameters,
+
+    * jobinfos is a type of JobInfoMap
+    * command is the subcommand given on the command line. When it
+      is a job, only that job gets a parser with its parameters as
+      options; the other jobs are not registered at all
+    * prefix is the partial subcommand being tab completed. When
+      command is None, only the jobs starting with prefix are
+      registered, without their options, so they can be listed
+    * jobnames is an optional sorted list of job names to list
+      instead of the jobs in jobinfos
+    '''
+    # create sub parser objects
+    subparsers = optionparser.add_subparsers()
+
+    if command is not None:
+        if command in jobinfos:
+            build_job_options(subparsers, command, jobinfos[command])
+    else:
+        if jobnames is None:
+            jobnames = sorted(jobinfos)
+        for jobname in job_names_with_prefix(jobnames, prefix or ''):
+            subparsers.add_parser(jobname, help=jobname.replace('_', ' '))
 
     # setup command line options for copy-job
     subparser = subparsers.add_parser('copy-job', help='copy current jenkins job as a different name')
@@ -139,11 +134,119 @@ def build_cmdline_options(optionparser, jobinfos=None):
     subparser = subparsers.add_parser('list-disable-jobs', help='list all jenkins jobs that are disable')
     subparser.set_defaults(func=list_disable_jobs)
 
-    # setup command line option for list-disable-jobs
-    subparser = subparsers.add_parser('save-all-job-configs', help='export all job configurations for a jenkins server')
+    # setup command line options for enable-jobs and disable-jobs
+    for action in ('enable', 'disable'):
+        subparser = subparsers.add_parser('%s-jobs' % action,
+                                          help='%s the jenkins jobs matching a regex or in a view' % action,
+                                          formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+        add_job_selection_options(subparser)
+        subparser.add_argument('--no-dry-run',
+                               help='really %s the jobs instead of listing them' % action,
+                               action='store_false',
+                               default=True,
+                               dest='dry_run')
+        subparser.set_defaults(func=enable_jobs if action == 'enable' else disable_jobs)
+
+    # setup command line option for save-all-job-configs
+    subparser = subparsers.add_parser('save-all-job-configs',
+                                      help='export all job configurations for a jenkins server',
+                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    add_job_selection_options(subparser)
+    subparser.add_argument('--archive',
+                           help='write the configurations into one .tar.gz file instead of one file per job',
+                           default=None)
     subparser.set_defaults(func=save_all_job_configs)
     return optionparser
 
+def add_job_selection_options(subparser):
+    '''
+    add the options a bulk job command uses to select jobs
+    '''
+    subparser.add_argument('--regex', '-r', help='a regex job names have to match', default=None)
+    subparser.add_argument('--view', '-v', help='a jenkins view the jobs have to be in', default=None)
+    subparser.add_argument('--max-workers', '-w',
+                           help='how many jobs are worked on at the same time',
+                           default=8,
+                           type=types.IntType,
+                           dest='max_workers')
+
+def build_job_options(subparsers, jobname, jobinfo=None):
+    '''
+    add a subcommand for a jenkins job, with an option for each of
+    its parameters. This function takes these parameters,
+
+    * subparsers is what ArgumentParser.add_subparsers returns
+    * jobname is the name of the job
+    * jobinfo is a type of JobInfo
+    '''
+    # create a parser for subcommand
+    subparser = subparsers.add_parser(jobname,
+                                      help=jobname.replace('_', ' '),
+                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    if not jobinfo.has_dryrun:
+        subparser.add_argument('--dry_run',
+                               help='see what job do without executing it, True by default',
+                               action='store_true',
+                               default=True)
+
+    # get job parameters and iterate through them to build subcommand options
+    params = jobinfo.parameters
+    for param in params:
+        opt_type = params[param].type
+        if not 'Separator' in opt_type:
+            opt_name    = '--%s' % param
+            opt_default = params[param].default
+            opt_help    = params[param].description
+            opt_choices = params[param].value if 'Choice' in opt_type else None
+            if opt_choices:
+                if 'Required' in opt_default:
+                    subparser.add_argument(opt_name,
+                                           choices=opt_choices,
+                                           required=True,
+                                           default=opt_default)
+                else:
+                    subparser.add_argument(opt_name,
+                                           choices=opt_choices,
+                                           default=opt_default)
+            else:
+                subparser.add_argument(opt_name,
+                                       help=opt_help,
+                                       default=opt_default)
+    subparser.set_defaults(func=jobinfo.build)
+    return subparser
+
+def job_names_with_prefix(jobnames=None, prefix=''):
+    '''
+    return the names in a sorted list of job names that start with
+    prefix. The matching names are next to each other, so they are
+    found with a binary search instead of a scan
+    '''
+    start = bisect.bisect_left(jobnames, prefix)
+    end   = start
+    while end < len(jobnames) and jobnames[end].startswith(prefix):
+        end += 1
+    return jobnames[start:end]
+
+def find_command(optionparser, argv=None):
+    '''
+    return (command, prefix) for a command line, where command is the
+    first subcommand given and prefix is the word being tab completed.
+    When argcomplete is completing, the command line is read from
+    COMP_LINE; otherwise argv or sys.argv is used and prefix is None
+    '''
+    prefix = None
+    if '_ARGCOMPLETE' in os.environ:
+        comp_line = os.environ['COMP_LINE']
+        comp_point = int(os.environ.get('COMP_POINT', len(comp_line)))
+        _, prefix, _, comp_words, _ = argcomplete.split_line(comp_line[:comp_point])
+        argv = comp_words[1:]
+    elif argv is None:
+        argv = sys.argv[1:]
+
+    extras   = optionparser.parse_known_args(argv)[1]
+    commands = [arg for arg in extras if not arg.startswith('-')]
+    return (commands[0] if commands else None), prefix
+
 def copy_job(args):
     '''
     create a copy of a given jenkins job
@@ -162,7 +265,25 @@ def enable_job(args):
 
 def disable_job(args):
     jobname  = args.job_name
-    jobinfomap[jobname].diable()
+    jobinfomap[jobname].disable()
+
+def enable_jobs(args):
+    results = jobinfomap.enable_jobs(args.regex, args.view, args.dry_run, args.max_workers)
+    print_job_results(results)
+
+def disable_jobs(args):
+    results = jobinfomap.disable_jobs(args.regex, args.view, args.dry_run, args.max_workers)
+    print_job_results(results)
+
+def print_job_results(results=None):
+    '''
+    print a { job name: result } hash returned by a bulk job command
+    '''
+    for job in sorted(results):
+        print('%s: %s' % (job, results[job]))
+    failed = len([job for job in results if str(results[job]).startswith('failed')])
+    print('---')
+    print('%d jobs, %d failed' % (len(results), failed))
 
 def list_all_jobs(args):
     print('----')
@@ -176,9 +297,13 @@ def list_disable_jobs(args):
             print(job)
 
 def save_all_job_configs(args):
-    for jobinfo in jobinfomap:
-        jobinfomap[jobinfo].workspace = os.path.join('tmp', jobinfomap[jobinfo].section)
-        jobinfomap[jobinfo].save_job_config()
+    workspace = os.path.join('tmp', jenkins.section)
+    results   = jobinfomap.save_job_configs(workspace,
+                                            args.regex,
+                                            args.view,
+                                            args.archive,
+                                            args.max_workers)
+    print_job_results(results)
 
 if __name__ == '__main__':
     jenkins()
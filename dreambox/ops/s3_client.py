@@ -1,4 +1,5 @@
 import dreambox.aws.s3 as s3
+from dreambox.aws.regions import for_each_region
 import dreambox.utils
 import dreambox.json.core as json
 
@@ -72,12 +73,11 @@ when function call is successful, a dictionary object is return with the followi
         regions = {'us-east-1': 'east-backup-databag',
                    'us-west-2': 'west-backup-databag',}
 
-    bucket_backupsets = {}
-    for region, envroot in regions.items():
-        bucket_backupsets[region] = get_backupset_bucketnames(envroot=envroot,
-                                                              ownerroot=ownerroot,
-                                                              region=region,
-                                                              verbose=verbose)
+    bucket_backupsets = for_each_region(lambda region: get_backupset_bucketnames(envroot=regions[region],
+                                                                                 ownerroot=ownerroot,
+                                                                                 region=region,
+                                                                                 verbose=verbose),
+                                        regions.keys())
     return bucket_backupsets
 
 
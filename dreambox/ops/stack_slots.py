@@ -0,0 +1,191 @@
+from __future__ import print_function
+from contextlib import contextmanager
+import dreambox.utils
+import bisect
+import fcntl
+import json
+import os
+import re
+import tempfile
+import time
+
+# a stage stack name and its slot number, i.e. stage12
+STAGE_PATTERN = r'^stage(\d+)$'
+
+# how many seconds a leased slot stays reserved when no stack shows up for it
+DEFAULT_LEASE_TTL = 2 * 60 * 60
+
+
+def stage_number(name=None):
+    '''
+    return the slot number of a stage stack name, i.e. 12 for Stage12, or None
+    if name is not a stage stack
+    '''
+    found = dreambox.utils.compile_regex(STAGE_PATTERN, re.I).match(name or '')
+    if found:
+        return int(found.group(1))
+    return None
+
+
+class SlotIndex(object):
+    '''
+SlotIndex is a sorted set of the slot numbers used in a region.  Slots start
+at 1.  The constructor takes one parameter,
+
+* slots is a list of used slot numbers; None and numbers below 1 are ignored
+    '''
+
+    def __init__(self, slots=None):
+        self._slots = sorted(set(slot for slot in slots or [] if slot is not None and slot > 0))
+
+    def add(self, slot=None):
+        index = bisect.bisect_left(self._slots, slot)
+        if index == len(self._slots) or self._slots[index] != slot:
+            self._slots.insert(index, slot)
+
+    def first_free(self):
+        '''
+        return the lowest slot that is not used.  The slots are sorted and
+        unique, so the first i with slots[i] > i + 1 is the first gap; it is
+        found with a binary search.
+        '''
+        low, high = 0, len(self._slots)
+        while low < high:
+            middle = (low + high) // 2
+            if self._slots[middle] > middle + 1:
+                high = middle
+            else:
+                low = middle + 1
+        return low + 1
+
+    def __contains__(self, slot):
+        index = bisect.bisect_left(self._slots, slot)
+        return index < len(self._slots) and self._slots[index] == slot
+
+    def __iter__(self):
+        return iter(self._slots)
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class SlotLeases(object):
+    '''
+SlotLeases keeps the slots handed out recently in a json lease file, so jobs
+running at the same time do not pick the same slot before its stack exists.
+The file is read and written under an exclusive lock.  The constructor takes
+these parameters,
+
+* path is the lease file; a .lock file is created next to it
+* ttl is how many seconds a lease is kept
+* owner is recorded with each lease.  If it is None, BUILD_TAG or the current
+  user is used
+
+the file holds { slot: { 'owner': ..., 'region': ..., 'expires': epoch } }.
+A lease is keyed on the slot number alone, since the stageN chef environment
+a slot becomes is the same in every region; a leased slot is used in all of
+them.  A lease ends when it expires, when it is released, or once a stack
+for its slot exists.
+    '''
+
+    def __init__(self, path=None, ttl=DEFAULT_LEASE_TTL, owner=None):
+        self.path  = path
+        self.ttl   = ttl
+        self.owner = owner or os.environ.get('BUILD_TAG') or dreambox.utils.get_current_user()
+        self._leases = {}
+
+    @contextmanager
+    def locked(self):
+        '''
+        hold the lease file lock, and yield self with the unexpired leases
+        loaded.  Leases changed inside the block are written when it ends.
+        '''
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._leases = self._load()
+                yield self
+                self._save()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def leased(self):
+        '''
+        return the leased slots
+        '''
+        return [int(slot) for slot in self._leases]
+
+    def acquire(self, region=None, slot=None):
+        '''
+        lease a slot for a stack in a region
+        '''
+        self._leases[str(slot)] = {'owner': self.owner,
+                                   'region': region,
+                                   'expires': time.time() + self.ttl}
+
+    def release(self, slot=None):
+        '''
+        end the lease of a slot, and return whether it was leased
+        '''
+        return self._leases.pop(str(slot), None) is not None
+
+    def reclaim(self, region_stacks=None):
+        '''
+        end the leases whose stack exists by now in the region it was leased
+        for; the stack keeps the slot taken from here on.  region_stacks is
+        a hash of { region: [ stack name, ... ] }
+        '''
+        for slot, lease in list(self._leases.items()):
+            stacks = region_stacks.get(lease.get('region')) or []
+            if int(slot) in [stage_number(stack) for stack in stacks]:
+                self.release(slot)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as fh:
+            content = fh.read()
+        leases = json.loads(content) if content.strip() else {}
+
+        # entries without an expiry, i.e. the { region: { slot: lease } }
+        # layout of older files, are dropped
+        now = time.time()
+        return dict((slot, lease) for slot, lease in leases.items()
+                    if isinstance(lease, dict) and lease.get('expires', 0) > now)
+
+    def _save(self):
+        # write to a temporary file first, so a reader never sees half a file
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.leases-')
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(self._leases, fh, indent=2, sort_keys=True)
+        os.rename(tmp, self.path)
+
+
+def find_free_slots(region_stacks=None, leases=None):
+    '''
+find_free_slots returns { region: first free slot } for a hash of
+{ region: [ stack name, ... ] }.  The function takes these parameters,
+
+* region_stacks is what get_stack_names_from_all_regions returns
+* leases is an optional SlotLeases; leased slots count as used in every
+  region
+    '''
+    leased = leases.leased() if leases is not None else []
+    free_slots = {}
+    for region, stacks in region_stacks.items():
+        index = SlotIndex(stage_number(stack) for stack in stacks or [])
+        for slot in leased:
+            index.add(slot)
+        free_slots[region] = index.first_free()
+    return free_slots
+
+
+def pick_slot(free_slots=None):
+    '''
+    return the (region, slot) with the lowest free slot; regions are compared
+    by name when their slots are the same
+    '''
+    if not free_slots:
+        return None, None
+    return min(sorted(free_slots.items()), key=lambda item: item[1])
@@ -12,6 +12,18 @@ import os
 import pwd
 import collections
 import logging
+import threading
+
+# how many compiled regular expressions compile_regex keeps, least recently
+# used first
+REGEX_CACHE_SIZE = 256
+
+# patterns a MultiMatcher combines into one regular expression; python 2
+# allows at most 100 groups in a regular expression
+MULTI_MATCHER_BATCH = 40
+
+__regex_cache = collections.OrderedDict()
+__regex_lock = threading.Lock()
 
 def initialize_logging():
     # Set this environment variable to add the logger name to messages,
@@ -78,12 +90,81 @@ def filter_list_by(my_dict=None, myfilter=None):
     return results
 
 
+def compile_regex(pattern=None, flags=0):
+    '''
+compile_regex returns a compiled regular expression from a registry shared by
+the filters of this package, so a pattern is compiled once no matter how often
+a filter runs.  The registry keeps the REGEX_CACHE_SIZE most recently used
+expressions.  The function takes these parameters,
+
+* pattern is a regular expression
+* flags are re flags, i.e. re.I
+    '''
+    key = (pattern, flags)
+    with __regex_lock:
+        regex = __regex_cache.pop(key, None)
+        if regex is None:
+            regex = re.compile(pattern, flags)
+        __regex_cache[key] = regex
+        if len(__regex_cache) > REGEX_CACHE_SIZE:
+            __regex_cache.popitem(last=False)
+    return regex
+
+
+class MultiMatcher(object):
+    '''
+MultiMatcher matches a string against several regular expressions in one
+pass, by combining them into a single alternation with a named group per
+pattern.  The constructor takes these parameters,
+
+* patterns is a list of regular expressions, i.e. one per stage
+* flags are re flags applied to every pattern
+    '''
+
+    def __init__(self, patterns=None, flags=0):
+        self.patterns = list(patterns or [])
+        self._regexes = []
+        for offset in range(0, len(self.patterns), MULTI_MATCHER_BATCH):
+            batch = self.patterns[offset:offset + MULTI_MATCHER_BATCH]
+            combined = '|'.join('(?P<p%d>%s)' % (offset + i, pattern) for i, pattern in enumerate(batch))
+            self._regexes.append(compile_regex(combined, flags))
+
+    def match(self, value=None):
+        '''
+        return the first pattern that matches the beginning of value, or None
+        '''
+        for regex in self._regexes:
+            found = regex.match(value)
+            if found:
+                return self.patterns[int(found.lastgroup[1:])]
+        return None
+
+    def partition(self, values=None):
+        '''
+        return { pattern: [ matching values ] } for a list of values, in a
+        single pass over the list.  Values no pattern matches are left out.
+        '''
+        result = dict((pattern, []) for pattern in self.patterns)
+        for value in values or []:
+            pattern = self.match(value)
+            if pattern is not None:
+                result[pattern].append(value)
+        return result
+
+
+def compile_multi_regex(patterns=None, flags=0):
+    '''
+compile_multi_regex returns a MultiMatcher for a list of patterns.  The
+combined expressions come from the compile_regex registry.
+    '''
+    return MultiMatcher(patterns, flags)
+
+
 def create_hashtable_from_hashes(ahash=None, filterby=None):
     chunk_table = {}
     hash_tables = {}
     hash_table = {}
-    regex_pattern = r'{0}\b'.format(filterby)
-    m = re.compile(regex_pattern, re.I)
+    m = compile_regex(r'{0}\b'.format(filterby), re.I)
     for region, ingresses in ahash.items():
         chunk_table[region] = chunks(2, ingresses)
 
@@ -110,8 +191,7 @@ def create_hashtable_from_hashes(ahash=None, filterby=None):
 
 def create_hashtable_from_hashes2(ahash=None, filterby=None):
     hashtable = {}
-    regex_pattern = r'{0}\b'.format(filterby)
-    m = re.compile(regex_pattern, re.I)
+    m = compile_regex(r'{0}\b'.format(filterby), re.I)
 
     def filter_element(x):
         if len(x[1]) > 0: